@@ -2,8 +2,32 @@
 # Author: Jon Fast
 # Last Modified: 10/7/2014
 
+import argparse
+import collections.abc
+import concurrent.futures
+import contextlib
+import fnmatch
+import gc
+import hashlib
+import io
+import itertools
+import json
+import locale
+import os
+import pickle
 import re
-import pymssql
+import queue
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import pymssql
+except ImportError:
+    # only needed to read the catalog from a live database
+    pymssql = None
 
 # common delimiters
 commaDelim = ', '
@@ -35,21 +59,402 @@ skipFields = ['username']
 replacementFields = { 'username' : 'DealSpan.Security.GetUsername()' }
 replacementParameters = { 'transactionID' : 'TransactionID' }
 
-typeConverter = { 'nvarchar' : {'type' : 'string', 'default' : '\"\"' },
-                   'varchar' : { 'type' : 'string', 'default' : '\"\"' },
-                   'text' : { 'type' : 'string', 'default' : '\"\"' },
-                   'int' : { 'type' : 'int', 'default' : '0' },
-                   'decimal' : { 'type' : 'decimal', 'default' : '0.0' },
-                   'bit' : { 'type' : 'bool', 'default' : 'false' },
-                   'table type' : { 'type' : 'DataTable', 'default' : 'new DataTable()'},
-                   'datetime' : {'type' : 'DateTime', 'default' : 'new DateTime()'},
-                   'date' : {'type' : 'DateTime', 'default' : 'new DateTime()'},
-                   'datetimeoffset' : {'type' : 'DateTimeOffset', 'default' : 'new DateTimeOffset()'}
+# 'reader' is the SqlDataReader getter used by typed result readers, 'sqlDbType' the SqlParameter type
+typeConverter = { 'nvarchar' : {'type' : 'string', 'default' : '\"\"', 'reader' : 'GetString', 'sqlDbType' : 'NVarChar' },
+                   'varchar' : { 'type' : 'string', 'default' : '\"\"', 'reader' : 'GetString', 'sqlDbType' : 'VarChar' },
+                   'nchar' : { 'type' : 'string', 'default' : '\"\"', 'reader' : 'GetString', 'sqlDbType' : 'NChar' },
+                   'char' : { 'type' : 'string', 'default' : '\"\"', 'reader' : 'GetString', 'sqlDbType' : 'Char' },
+                   'text' : { 'type' : 'string', 'default' : '\"\"', 'reader' : 'GetString', 'sqlDbType' : 'Text' },
+                   'ntext' : { 'type' : 'string', 'default' : '\"\"', 'reader' : 'GetString', 'sqlDbType' : 'NText' },
+                   'xml' : { 'type' : 'string', 'default' : '\"\"', 'reader' : 'GetString', 'sqlDbType' : 'Xml' },
+                   'bigint' : { 'type' : 'long', 'default' : '0', 'reader' : 'GetInt64', 'sqlDbType' : 'BigInt' },
+                   'int' : { 'type' : 'int', 'default' : '0', 'reader' : 'GetInt32', 'sqlDbType' : 'Int' },
+                   'smallint' : { 'type' : 'short', 'default' : '0', 'reader' : 'GetInt16', 'sqlDbType' : 'SmallInt' },
+                   'tinyint' : { 'type' : 'byte', 'default' : '0', 'reader' : 'GetByte', 'sqlDbType' : 'TinyInt' },
+                   'decimal' : { 'type' : 'decimal', 'default' : '0.0', 'reader' : 'GetDecimal', 'sqlDbType' : 'Decimal' },
+                   'numeric' : { 'type' : 'decimal', 'default' : '0.0', 'reader' : 'GetDecimal', 'sqlDbType' : 'Decimal' },
+                   'money' : { 'type' : 'decimal', 'default' : '0.0', 'reader' : 'GetDecimal', 'sqlDbType' : 'Money' },
+                   'smallmoney' : { 'type' : 'decimal', 'default' : '0.0', 'reader' : 'GetDecimal', 'sqlDbType' : 'SmallMoney' },
+                   'float' : { 'type' : 'double', 'default' : '0.0', 'reader' : 'GetDouble', 'sqlDbType' : 'Float' },
+                   'real' : { 'type' : 'float', 'default' : '0.0f', 'reader' : 'GetFloat', 'sqlDbType' : 'Real' },
+                   'bit' : { 'type' : 'bool', 'default' : 'false', 'reader' : 'GetBoolean', 'sqlDbType' : 'Bit' },
+                   'uniqueidentifier' : { 'type' : 'Guid', 'default' : 'Guid.Empty', 'reader' : 'GetGuid', 'sqlDbType' : 'UniqueIdentifier' },
+                   'varbinary' : { 'type' : 'byte[]', 'default' : 'new byte[0]', 'reader' : 'GetFieldValue<byte[]>', 'sqlDbType' : 'VarBinary' },
+                   'binary' : { 'type' : 'byte[]', 'default' : 'new byte[0]', 'reader' : 'GetFieldValue<byte[]>', 'sqlDbType' : 'Binary' },
+                   'image' : { 'type' : 'byte[]', 'default' : 'new byte[0]', 'reader' : 'GetFieldValue<byte[]>', 'sqlDbType' : 'Image' },
+                   'table type' : { 'type' : 'DataTable', 'default' : 'new DataTable()', 'sqlDbType' : 'Structured' },
+                   'datetime' : {'type' : 'DateTime', 'default' : 'new DateTime()', 'reader' : 'GetDateTime', 'sqlDbType' : 'DateTime' },
+                   'datetime2' : {'type' : 'DateTime', 'default' : 'new DateTime()', 'reader' : 'GetDateTime', 'sqlDbType' : 'DateTime2' },
+                   'smalldatetime' : {'type' : 'DateTime', 'default' : 'new DateTime()', 'reader' : 'GetDateTime', 'sqlDbType' : 'SmallDateTime' },
+                   'date' : {'type' : 'DateTime', 'default' : 'new DateTime()', 'reader' : 'GetDateTime', 'sqlDbType' : 'Date' },
+                   'time' : {'type' : 'TimeSpan', 'default' : 'new TimeSpan()', 'reader' : 'GetTimeSpan', 'sqlDbType' : 'Time' },
+                   'datetimeoffset' : {'type' : 'DateTimeOffset', 'default' : 'new DateTimeOffset()', 'reader' : 'GetDateTimeOffset', 'sqlDbType' : 'DateTimeOffset' },
+                   'sql_variant' : { 'type' : 'object', 'default' : 'null', 'reader' : 'GetValue', 'sqlDbType' : 'Variant' }
                    }
+# result columns of any other type are read as object
+untypedResultColumn = { 'type' : 'object', 'reader' : 'GetValue' }
+clrReferenceTypes = ['string', 'object', 'byte[]', 'DataTable']
+# sized in characters (bytes for the binary types) in column definitions
+lengthTypes = ['nvarchar', 'varchar', 'nchar', 'char', 'varbinary', 'binary']
+precisionTypes = ['decimal', 'numeric']
+# fractional second types, a parameter's scale is their DATETIME_PRECISION
+scaledTimeTypes = ['datetime2', 'time', 'datetimeoffset']
+# can't be compared by except, or stored in a memory optimized table type
+largeObjectTypes = ['text', 'ntext', 'image', 'xml']
+
+# generation switches set from the command line, part of the generator version
+# so that changing one regenerates every object in incremental mode
+generationOptions = { 'typedReaders' : False, 'async' : False, 'mergeMode' : 'full', 'keyedTableTypes' : False, 'memoryOptimized' : False,
+                      'bulkSetters' : False, 'schema' : 'dbo', 'compact' : False, 'splitClasses' : False }
+# async accessors read described result sets this wide with CommandBehavior.SequentialAccess
+wideRowColumnCount = 20
+# bulk setters: rows sent per SqlBulkCopy batch, and the row count from which Set<Table>Auto bulk copies
+bulkCopyBatchSize = 10000
+bulkCopyThreshold = 50000
+
+# output templates, one per artifact kind; {{name}} placeholders are filled from the context
+# each emitter builds, a placeholder value is either a string or an iterable of string fragments
+# (an iterable used more than once in a template is joined into a string first)
+defaultTemplates = {
+    'xmlComment' : '/// <summary>\n/// {{action}}s {{title}}\n/// </summary>{{returns}}\n',
+    'tableType' : '\n-- Table type for: {{tableName}}\n'
+                  + 'create type {{schemaPrefix}}{{tableName}}Table as table (\n'
+                  + '{{columnDefinitions}}{{keyDefinition}}'
+                  + '\n){{tableOptions}}\ngo\n\n',
+    'mergeProc' : '\n-- {{mergeTitle}} for: {{tableName}}\n'
+                  + 'create procedure {{procName}}\n'
+                  + '{{sourceParameter}}'
+                  + 'as\n'
+                  + 'begin\n'
+                  + '\tmerge {{schemaPrefix}}{{tableName}} as target\n'
+                  + '\tusing {{source}} as source\n'
+                  + ' {{joinConditions}}'
+                  + '\twhen matched then update set\n'
+                  + '{{updateAssignments}}\n'
+                  + '\twhen not matched by target then\n'
+                  + '\t\tinsert \n\t\t(\n'
+                  + '{{insertColumns}}'
+                  + '\n\t\t)\n\t\tvalues\n\t\t(\n'
+                  + '{{insertValues}}'
+                  + '\n\t\t)\n'
+                  + '\twhen not matched by source then delete;\n'
+                  + 'end;\ngo\n',
+    'mergeProcDelta' : '\n-- {{mergeTitle}} for: {{tableName}}\n'
+                       + 'create procedure {{procName}}\n'
+                       + '{{sourceParameter}}'
+                       + 'as\n'
+                       + 'begin\n'
+                       + '\tset nocount on;\n'
+                       + '{{targetScope}}'
+                       + '\tmerge {{mergeTarget}} as target\n'
+                       + '\tusing {{source}} as source\n'
+                       + '{{joinConditions}}'
+                       + '{{matchedClause}}'
+                       + '\twhen not matched by target then\n'
+                       + '\t\tinsert \n\t\t(\n'
+                       + '{{insertColumns}}'
+                       + '\n\t\t)\n\t\tvalues\n\t\t(\n'
+                       + '{{insertValues}}'
+                       + '\n\t\t){{deleteClause}};\n'
+                       + 'end;\ngo\n',
+    'mergeProcWithoutKey' : '-- Merge statement could not be written for {{tableName}} as it\n'
+                            + '-- contains no primary key columns for comparison in the \'on\' statement. \n',
+    'dataSetter' : '{{xmlComment}}'
+                   + 'internal static void Set{{tableName}}(DataTable {{tableParameterName}}) \n{\n'
+                   + '\tDataAccess.SetData("{{schemaPrefix}}Set{{tableName}}", new SqlParameter[] {\n'
+                   + '\t\t new SqlParameter("@{{tableName}}Table", SqlDbType.Structured) { TypeName = "{{schemaPrefix}}{{tableName}}Table", Value = {{tableParameterName}} }\n'
+                   + '\t});\n'
+                   + '}\n\n',
+    'bulkSetter' : '{{xmlComment}}'
+                   + 'internal static void BulkSet{{tableName}}(IDataReader rows, int batchSize = {{batchSize}}) \n{\n'
+                   + '\tusing (SqlConnection connection = new SqlConnection(DataAccess.ConnectionString))\n\t{\n'
+                   + '\t\tconnection.Open();\n'
+                   + '\t\tusing (SqlTransaction transaction = connection.BeginTransaction())\n\t\t{\n'
+                   + '\t\t\tusing (SqlCommand command = new SqlCommand("create table {{stagingTable}} ({{stagingColumns}})", connection, transaction))\n\t\t\t{\n'
+                   + '\t\t\t\tcommand.ExecuteNonQuery();\n'
+                   + '\t\t\t}\n'
+                   + '\t\t\tusing (SqlBulkCopy bulkCopy = new SqlBulkCopy(connection, SqlBulkCopyOptions.TableLock, transaction))\n\t\t\t{\n'
+                   + '\t\t\t\tbulkCopy.DestinationTableName = "{{stagingTable}}";\n'
+                   + '\t\t\t\tbulkCopy.BatchSize = batchSize;\n'
+                   + '\t\t\t\tbulkCopy.BulkCopyTimeout = 0;\n'
+                   + '\t\t\t\tbulkCopy.EnableStreaming = true;\n'
+                   + '{{columnMappings}}'
+                   + '\t\t\t\tbulkCopy.WriteToServer(rows);\n'
+                   + '\t\t\t}\n'
+                   + '\t\t\tusing (SqlCommand command = new SqlCommand("{{schemaPrefix}}Set{{tableName}}FromStaging", connection, transaction))\n\t\t\t{\n'
+                   + '\t\t\t\tcommand.CommandType = CommandType.StoredProcedure;\n'
+                   + '\t\t\t\tcommand.CommandTimeout = 0;\n'
+                   + '\t\t\t\tcommand.ExecuteNonQuery();\n'
+                   + '\t\t\t}\n'
+                   + '\t\t\ttransaction.Commit();\n'
+                   + '\t\t}\n\t}\n}\n\n'
+                   + 'internal static void BulkSet{{tableName}}(DataTable {{tableParameterName}}, int batchSize = {{batchSize}}) \n{\n'
+                   + '\tusing (DataTableReader rows = {{tableParameterName}}.CreateDataReader())\n\t{\n'
+                   + '\t\tBulkSet{{tableName}}(rows, batchSize);\n'
+                   + '\t}\n}\n\n'
+                   + '/// <summary>\n/// Sets {{title}} through the table valued parameter for small batches and bulk copy for large ones\n/// </summary>\n'
+                   + 'internal static void Set{{tableName}}Auto(DataTable {{tableParameterName}}) \n{\n'
+                   + '\tif ({{tableParameterName}}.Rows.Count >= {{bulkThreshold}})\n'
+                   + '\t\tBulkSet{{tableName}}({{tableParameterName}});\n'
+                   + '\telse\n'
+                   + '\t\tSet{{tableName}}({{tableParameterName}});\n'
+                   + '}\n\n',
+    'asyncBulkSetter' : '{{xmlComment}}'
+                        + 'internal static async Task BulkSet{{tableName}}Async(IDataReader rows, int batchSize = {{batchSize}}, CancellationToken cancellationToken = default(CancellationToken)) \n{\n'
+                        + '\tusing (SqlConnection connection = new SqlConnection(DataAccess.ConnectionString))\n\t{\n'
+                        + '\t\tawait connection.OpenAsync(cancellationToken);\n'
+                        + '\t\tusing (SqlTransaction transaction = connection.BeginTransaction())\n\t\t{\n'
+                        + '\t\t\tusing (SqlCommand command = new SqlCommand("create table {{stagingTable}} ({{stagingColumns}})", connection, transaction))\n\t\t\t{\n'
+                        + '\t\t\t\tawait command.ExecuteNonQueryAsync(cancellationToken);\n'
+                        + '\t\t\t}\n'
+                        + '\t\t\tusing (SqlBulkCopy bulkCopy = new SqlBulkCopy(connection, SqlBulkCopyOptions.TableLock, transaction))\n\t\t\t{\n'
+                        + '\t\t\t\tbulkCopy.DestinationTableName = "{{stagingTable}}";\n'
+                        + '\t\t\t\tbulkCopy.BatchSize = batchSize;\n'
+                        + '\t\t\t\tbulkCopy.BulkCopyTimeout = 0;\n'
+                        + '\t\t\t\tbulkCopy.EnableStreaming = true;\n'
+                        + '{{columnMappings}}'
+                        + '\t\t\t\tawait bulkCopy.WriteToServerAsync(rows, cancellationToken);\n'
+                        + '\t\t\t}\n'
+                        + '\t\t\tusing (SqlCommand command = new SqlCommand("{{schemaPrefix}}Set{{tableName}}FromStaging", connection, transaction))\n\t\t\t{\n'
+                        + '\t\t\t\tcommand.CommandType = CommandType.StoredProcedure;\n'
+                        + '\t\t\t\tcommand.CommandTimeout = 0;\n'
+                        + '\t\t\t\tawait command.ExecuteNonQueryAsync(cancellationToken);\n'
+                        + '\t\t\t}\n'
+                        + '\t\t\ttransaction.Commit();\n'
+                        + '\t\t}\n\t}\n}\n\n'
+                        + 'internal static async Task BulkSet{{tableName}}Async(DataTable {{tableParameterName}}, int batchSize = {{batchSize}}, CancellationToken cancellationToken = default(CancellationToken)) \n{\n'
+                        + '\tusing (DataTableReader rows = {{tableParameterName}}.CreateDataReader())\n\t{\n'
+                        + '\t\tawait BulkSet{{tableName}}Async(rows, batchSize, cancellationToken);\n'
+                        + '\t}\n}\n\n'
+                        + '/// <summary>\n/// Sets {{title}} through the table valued parameter for small batches and bulk copy for large ones\n/// </summary>\n'
+                        + 'internal static Task Set{{tableName}}AutoAsync(DataTable {{tableParameterName}}, CancellationToken cancellationToken = default(CancellationToken)) \n{\n'
+                        + '\tif ({{tableParameterName}}.Rows.Count >= {{bulkThreshold}})\n'
+                        + '\t\treturn BulkSet{{tableName}}Async({{tableParameterName}}, {{batchSize}}, cancellationToken);\n'
+                        + '\treturn Set{{tableName}}Async({{tableParameterName}}, cancellationToken);\n'
+                        + '}\n\n',
+    'sharedDataSetter' : '/// <summary>\n/// Body shared by the table setters\n/// </summary>\n'
+                         + 'private static void SetTable(string procName, string parameterName, string typeName, DataTable table) \n{\n'
+                         + '\tDataAccess.SetData(procName, new SqlParameter[] {\n'
+                         + '\t\t new SqlParameter(parameterName, SqlDbType.Structured) { TypeName = typeName, Value = table }\n'
+                         + '\t});\n'
+                         + '}\n\n',
+    'compactDataSetter' : '{{xmlComment}}'
+                          + 'internal static void Set{{tableName}}(DataTable {{tableParameterName}}) => '
+                          + 'SetTable("{{schemaPrefix}}Set{{tableName}}", "@{{tableName}}Table", "{{schemaPrefix}}{{tableName}}Table", {{tableParameterName}});\n\n',
+    'dataSetterController' : '{{xmlComment}}'
+                             + '[Route("{{tableName}}")]\n'
+                             + 'public PostResult Put{{tableName}}([FromBody] DataTable {{tableParameterName}})\n'
+                             + '{\n'
+                             + '\tModels.Unknown.Set{{tableName}}({{tableParameterName}})\n'
+                             + '\treturn new PostResult(PostResult.ResultType.Success);\n'
+                             + '}\n\n',
+    'accessor' : '{{xmlComment}}'
+                 + 'internal static {{returnType}} {{methodName}}({{parameters}}) \n{\n'
+                 + '\t{{returnStatement}}{{conversionBegin}}DataAccess.{{dataAccessMethod}}("{{schemaPrefix}}{{procName}}"{{sqlParameters}}){{conversionEnd}};\n'
+                 + '}\n\n',
+    'sharedAccessor' : '/// <summary>\n/// Body shared by {{procCount}} {{action}} accessors with the same parameters and return type\n/// </summary>\n'
+                       + 'private static {{returnType}} {{helperName}}(string procName{{helperParameters}}) \n{\n'
+                       + '\t{{returnStatement}}{{conversionBegin}}DataAccess.{{dataAccessMethod}}(procName{{sqlParameters}}){{conversionEnd}};\n'
+                       + '}\n\n',
+    'compactAccessor' : '{{xmlComment}}'
+                        + 'internal static {{returnType}} {{methodName}}({{parameters}}) => {{helperName}}("{{schemaPrefix}}{{procName}}"{{helperArguments}});\n\n',
+    'getController' : '{{xmlComment}}'
+                      + '[Route("{{route}}")]\n'
+                      + 'public {{returnType}} {{procName}}({{parameters}})\n'
+                      + '{\n'
+                      + '\treturn {{namespace}}{{procName}}({{arguments}});\n'
+                      + '}\n\n',
+    'setController' : '{{xmlComment}}'
+                      + '[Route("{{procName}}")]\n'
+                      + 'public {{returnType}} {{methodName}}([FromBody] JObject {{jObjectName}})\n'
+                      + '{\n'
+                      + '\treturn Models.Transaction.{{procName}}(\n{{jObjectArguments}})\n'
+                      + '}\n\n',
+    'readRows' : '/// <summary>\n/// Streams the first result set of a stored procedure through a typed row reader\n/// </summary>\n'
+                 + 'internal static IEnumerable<T> ReadRows<T>(string procName, Func<SqlDataReader, Func<SqlDataReader, T>> createRowReader, params SqlParameter[] parameters)\n{\n'
+                 + '\tusing (SqlConnection connection = new SqlConnection(DataAccess.ConnectionString))\n'
+                 + '\tusing (SqlCommand command = new SqlCommand(procName, connection))\n\t{\n'
+                 + '\t\tcommand.CommandType = CommandType.StoredProcedure;\n'
+                 + '\t\tcommand.Parameters.AddRange(parameters);\n'
+                 + '\t\tconnection.Open();\n'
+                 + '\t\tusing (SqlDataReader reader = command.ExecuteReader(CommandBehavior.SingleResult))\n\t\t{\n'
+                 + '\t\t\tFunc<SqlDataReader, T> readRow = createRowReader(reader);\n'
+                 + '\t\t\twhile (reader.Read())\n\t\t\t{\n'
+                 + '\t\t\t\tyield return readRow(reader);\n'
+                 + '\t\t\t}\n\t\t}\n\t}\n}\n\n',
+    'resultRow' : '/// <summary>\n/// Row returned by {{procName}}\n/// </summary>\n'
+                  + 'public class {{rowClassName}}\n{\n{{properties}}}\n\n'
+                  + 'internal sealed class {{rowReaderName}}\n{\n'
+                  + '{{ordinalFields}}\n'
+                  + '\tinternal {{rowReaderName}}(SqlDataReader reader)\n\t{\n{{ordinalLookups}}\t}\n\n'
+                  + '\tinternal {{rowClassName}} Read(SqlDataReader reader)\n\t{\n'
+                  + '\t\treturn new {{rowClassName}}\n\t\t{\n{{assignments}}\n\t\t};\n\t}\n}\n\n',
+    'readerAccessor' : '{{xmlComment}}'
+                       + 'internal static {{returnType}} {{methodName}}({{parameters}}) \n{\n'
+                       + '\treturn ReadRows<{{rowClassName}}>("{{schemaPrefix}}{{procName}}", reader => new {{rowReaderName}}(reader).Read{{sqlParameters}}){{rowSelection}};\n'
+                       + '}\n\n',
+    'asyncHelpers' : '/// <summary>\n/// Fills a DataTable from a stored procedure without blocking the calling thread\n/// </summary>\n'
+                     + 'internal static async Task<DataTable> GetDataTableAsync(string procName, CommandBehavior behavior, CancellationToken cancellationToken, params SqlParameter[] parameters)\n{\n'
+                     + '\tusing (SqlConnection connection = new SqlConnection(DataAccess.ConnectionString))\n'
+                     + '\tusing (SqlCommand command = new SqlCommand(procName, connection))\n\t{\n'
+                     + '\t\tcommand.CommandType = CommandType.StoredProcedure;\n'
+                     + '\t\tcommand.Parameters.AddRange(parameters);\n'
+                     + '\t\tawait connection.OpenAsync(cancellationToken);\n'
+                     + '\t\tusing (SqlDataReader reader = await command.ExecuteReaderAsync(behavior | CommandBehavior.SingleResult, cancellationToken))\n\t\t{\n'
+                     + '\t\t\tDataTable table = new DataTable();\n'
+                     + '\t\t\tfor (int ordinal = 0; ordinal < reader.FieldCount; ordinal++)\n\t\t\t{\n'
+                     + '\t\t\t\tstring columnName = reader.GetName(ordinal);\n'
+                     + '\t\t\t\ttable.Columns.Add(table.Columns.Contains(columnName) ? columnName + ordinal : columnName, reader.GetFieldType(ordinal));\n'
+                     + '\t\t\t}\n'
+                     + '\t\t\tobject[] values = new object[reader.FieldCount];\n'
+                     + '\t\t\twhile (await reader.ReadAsync(cancellationToken))\n\t\t\t{\n'
+                     + '\t\t\t\treader.GetValues(values);\n'
+                     + '\t\t\t\ttable.Rows.Add(values);\n'
+                     + '\t\t\t}\n'
+                     + '\t\t\treturn table;\n'
+                     + '\t\t}\n\t}\n}\n\n'
+                     + '/// <summary>\n/// Runs a stored procedure that returns no rows without blocking the calling thread\n/// </summary>\n'
+                     + 'internal static async Task SetDataAsync(string procName, CancellationToken cancellationToken, params SqlParameter[] parameters)\n{\n'
+                     + '\tusing (SqlConnection connection = new SqlConnection(DataAccess.ConnectionString))\n'
+                     + '\tusing (SqlCommand command = new SqlCommand(procName, connection))\n\t{\n'
+                     + '\t\tcommand.CommandType = CommandType.StoredProcedure;\n'
+                     + '\t\tcommand.Parameters.AddRange(parameters);\n'
+                     + '\t\tawait connection.OpenAsync(cancellationToken);\n'
+                     + '\t\tawait command.ExecuteNonQueryAsync(cancellationToken);\n'
+                     + '\t}\n}\n\n'
+                     + '/// <summary>\n/// Streams the first result set of a stored procedure through a row reader as it arrives\n/// </summary>\n'
+                     + 'internal static async IAsyncEnumerable<T> ReadRowsAsync<T>(string procName, Func<SqlDataReader, Func<SqlDataReader, T>> createRowReader, CommandBehavior behavior, [EnumeratorCancellation] CancellationToken cancellationToken, params SqlParameter[] parameters)\n{\n'
+                     + '\tusing (SqlConnection connection = new SqlConnection(DataAccess.ConnectionString))\n'
+                     + '\tusing (SqlCommand command = new SqlCommand(procName, connection))\n\t{\n'
+                     + '\t\tcommand.CommandType = CommandType.StoredProcedure;\n'
+                     + '\t\tcommand.Parameters.AddRange(parameters);\n'
+                     + '\t\tawait connection.OpenAsync(cancellationToken);\n'
+                     + '\t\tusing (SqlDataReader reader = await command.ExecuteReaderAsync(behavior | CommandBehavior.SingleResult, cancellationToken))\n\t\t{\n'
+                     + '\t\t\tFunc<SqlDataReader, T> readRow = createRowReader(reader);\n'
+                     + '\t\t\twhile (await reader.ReadAsync(cancellationToken))\n\t\t\t{\n'
+                     + '\t\t\t\tyield return readRow(reader);\n'
+                     + '\t\t\t}\n\t\t}\n\t}\n}\n\n'
+                     + '/// <summary>\n/// Reads the first result set of a stored procedure into a list\n/// </summary>\n'
+                     + 'internal static async Task<List<T>> ReadListAsync<T>(string procName, Func<SqlDataReader, Func<SqlDataReader, T>> createRowReader, CommandBehavior behavior, CancellationToken cancellationToken, params SqlParameter[] parameters)\n{\n'
+                     + '\tList<T> rows = new List<T>();\n'
+                     + '\tawait foreach (T row in ReadRowsAsync(procName, createRowReader, behavior, cancellationToken, parameters))\n\t{\n'
+                     + '\t\trows.Add(row);\n'
+                     + '\t}\n'
+                     + '\treturn rows;\n}\n\n'
+                     + '/// <summary>\n/// Reads the first row returned by a stored procedure, or the default when there is none\n/// </summary>\n'
+                     + 'internal static async Task<T> ReadRowAsync<T>(string procName, Func<SqlDataReader, Func<SqlDataReader, T>> createRowReader, CommandBehavior behavior, CancellationToken cancellationToken, params SqlParameter[] parameters)\n{\n'
+                     + '\tawait foreach (T row in ReadRowsAsync(procName, createRowReader, behavior | CommandBehavior.SingleRow, cancellationToken, parameters))\n\t{\n'
+                     + '\t\treturn row;\n'
+                     + '\t}\n'
+                     + '\treturn default(T);\n}\n\n'
+                     + '/// <summary>\n/// Converts the current row of a reader to a JObject keyed by column name\n/// </summary>\n'
+                     + 'internal static JObject RowToJObject(SqlDataReader reader)\n{\n'
+                     + '\tJObject row = new JObject();\n'
+                     + '\tfor (int ordinal = 0; ordinal < reader.FieldCount; ordinal++)\n\t{\n'
+                     + '\t\trow[reader.GetName(ordinal)] = reader.IsDBNull(ordinal) ? JValue.CreateNull() : JToken.FromObject(reader.GetValue(ordinal));\n'
+                     + '\t}\n'
+                     + '\treturn row;\n}\n\n',
+    'asyncAccessor' : '{{xmlComment}}'
+                      + 'internal static {{asyncModifier}}{{asyncReturnType}} {{methodName}}Async({{asyncParameters}}) \n{\n'
+                      + '\treturn {{conversionBegin}}{{awaitKeyword}}{{asyncDataAccessMethod}}("{{schemaPrefix}}{{procName}}"{{rowReaderArgument}}, {{commandBehavior}}cancellationToken{{sqlParameters}}){{conversionEnd}};\n'
+                      + '}\n\n',
+    'asyncStreamAccessor' : '/// <summary>\n/// Streams the rows of {{procName}} as they are read\n/// </summary>\n'
+                            + 'internal static IAsyncEnumerable<{{streamRowType}}> {{methodName}}StreamAsync({{asyncParameters}}) \n{\n'
+                            + '\treturn ReadRowsAsync<{{streamRowType}}>("{{schemaPrefix}}{{procName}}", {{streamRowReader}}, {{commandBehavior}}cancellationToken{{streamSqlParameters}});\n'
+                            + '}\n\n',
+    'asyncGetController' : '{{xmlComment}}'
+                           + '[Route("{{route}}")]\n'
+                           + 'public async {{asyncReturnType}} {{procName}}({{asyncControllerParameters}})\n'
+                           + '{\n'
+                           + '\treturn await {{namespace}}{{methodName}}Async({{asyncArguments}});\n'
+                           + '}\n\n',
+    'asyncSetController' : '{{xmlComment}}'
+                           + '[Route("{{procName}}")]\n'
+                           + 'public async Task {{methodName}}([FromBody] JObject {{jObjectName}}, CancellationToken cancellationToken)\n'
+                           + '{\n'
+                           + '\tawait Models.Transaction.{{methodName}}Async(\n{{asyncJObjectArguments}});\n'
+                           + '}\n\n',
+    'asyncDataSetter' : '{{xmlComment}}'
+                        + 'internal static Task Set{{tableName}}Async(DataTable {{tableParameterName}}, CancellationToken cancellationToken = default(CancellationToken)) \n{\n'
+                        + '\treturn SetDataAsync("{{schemaPrefix}}Set{{tableName}}", cancellationToken, new SqlParameter[] {\n'
+                        + '\t\t new SqlParameter("@{{tableName}}Table", SqlDbType.Structured) { TypeName = "{{schemaPrefix}}{{tableName}}Table", Value = {{tableParameterName}} }\n'
+                        + '\t});\n'
+                        + '}\n\n',
+    'asyncDataSetterController' : '{{xmlComment}}'
+                                  + '[Route("{{tableName}}")]\n'
+                                  + 'public async Task<PostResult> Put{{tableName}}([FromBody] DataTable {{tableParameterName}}, CancellationToken cancellationToken)\n'
+                                  + '{\n'
+                                  + '\tawait Models.Unknown.Set{{tableName}}Async({{tableParameterName}}, cancellationToken);\n'
+                                  + '\treturn new PostResult(PostResult.ResultType.Success);\n'
+                                  + '}\n\n'
+    }
+templateFileExtension = '.template'
+templatePlaceholderPattern = r'\{\{\s*(\w+)\s*\}\}'
+
+def compileTemplate(templateName, templateText):
+    # turns a template into a generator function whose constant pieces are literals,
+    # so rendering an object only yields those literals and the context values
+    pieces = re.split(templatePlaceholderPattern, templateText)
+    codeLines = ['def render(context):', '\tyield from ()']
+    # iterables are consumed by their first use, so placeholders used more than once are joined up front
+    repeatedNames = sorted(set(name for name in pieces[1::2] if pieces[1::2].count(name) > 1))
+    for name in repeatedNames:
+        codeLines.append('\trepeated_' + name + ' = context[' + repr(name) + ']')
+        codeLines.append('\tif not isinstance(repeated_' + name + ', str):')
+        codeLines.append('\t\trepeated_' + name + " = ''.join(repeated_" + name + ')')
+    for index, piece in enumerate(pieces):
+        if index % 2 == 0:
+            if len(piece) != 0:
+                codeLines.append('\tyield ' + repr(piece))
+        elif piece in repeatedNames:
+            codeLines.append('\tyield repeated_' + piece)
+        else:
+            codeLines.append('\tvalue = context[' + repr(piece) + ']')
+            codeLines.append('\tif isinstance(value, str):')
+            codeLines.append('\t\tyield value')
+            codeLines.append('\telse:')
+            codeLines.append('\t\tyield from value')
+    namespace = {}
+    exec(compile('\n'.join(codeLines), '<template ' + templateName + '>', 'exec'), namespace)
+    return namespace['render']
+
+def readTemplates(directory):
+    # default templates, overridden by any <name>.template file found in directory
+    texts = dict(defaultTemplates)
+    if directory is not None:
+        for templateName in defaultTemplates:
+            path = os.path.join(directory, templateName + templateFileExtension)
+            if os.path.exists(path):
+                with open(path, 'r') as templateFile:
+                    texts[templateName] = templateFile.read()
+                # an override may only use the placeholders its default fills, checked before anything is written
+                unknownPlaceholders = set(re.findall(templatePlaceholderPattern, texts[templateName])) \
+                                      - set(re.findall(templatePlaceholderPattern, defaultTemplates[templateName]))
+                if len(unknownPlaceholders) != 0:
+                    raise ValueError(path + ' uses unknown placeholders: ' + commaDelim.join(sorted(unknownPlaceholders)))
+    return texts
+
+def writeTemplates(directory):
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    for templateName, templateText in defaultTemplates.items():
+        with open(os.path.join(directory, templateName + templateFileExtension), 'w') as templateFile:
+            templateFile.write(templateText)
+
+def setTemplates(texts):
+    global templateTexts, compiledTemplates
+    templateTexts = texts
+    compiledTemplates = dict((templateName, compileTemplate(templateName, templateText)) for templateName, templateText in texts.items())
+
+def renderTemplate(templateName, context):
+    return compiledTemplates[templateName](context)
+
+setTemplates(defaultTemplates)
 
 def getXMLComment(title, does):
     title = re.sub(r"(\w)([A-Z])", r"\1 \2", title).lower()
-    return '/// <summary>\n/// ' + does + 's ' + title + '\n/// </summary>' + ('\n/// <returns>' + title + '</returns>' if does.lower() == 'get' else '') + '\n'
+    return ''.join(renderTemplate('xmlComment', { 'action' : does, 'title' : title,
+                                                  'returns' : ('\n/// <returns>' + title + '</returns>' if does.lower() == 'get' else '') }))
 
 def quote(variable):
     return '\"' + variable + '\"'
@@ -63,6 +468,16 @@ def bracket(variable):
 def squareBracket(variable):
     return '[' + variable + ']'
 
+def delimited(fragments, delimiter):
+    # yields the fragments with the delimiter between them, so lists can be streamed out
+    # instead of built up and then stripped of their trailing delimiter
+    firstFragment = True
+    for fragment in fragments:
+        if not firstFragment:
+            yield delimiter
+        firstFragment = False
+        yield fragment
+
 def camelCase(variable):
     return variable[0].lower() + variable[1:]
 
@@ -97,12 +512,15 @@ def procJObjectName(procName):
     objectName = procName[3:] + 'Object'
     return objectName[0].lower() + objectName[1:]
 
+# catalog queries take the schema, and any object name, as query parameters; with parameters
+# pymssql formats the query string, so a literal % is written %%
 def setProcs(connection):
     cur = connection.cursor()
     queryString = "select SPECIFIC_NAME \n" \
                 + "from INFORMATION_SCHEMA.Routines \n" \
-                + "where ROUTINE_NAME LIKE 'Set%' and ROUTINE_TYPE = 'PROCEDURE'\n"
-    cur.execute(queryString)
+                + "where ROUTINE_NAME LIKE 'Set%%' and ROUTINE_TYPE = 'PROCEDURE'\n" \
+                + "and ROUTINE_SCHEMA = %s \n"
+    cur.execute(queryString, (generationOptions['schema'],))
     for proc in cur:
         procNames.append(proc[0])
         
@@ -110,17 +528,9 @@ def getProcs(connection):
     cur = connection.cursor()
     queryString = "select SPECIFIC_NAME \n" \
                 + "from INFORMATION_SCHEMA.Routines \n" \
-                + "where ROUTINE_NAME LIKE 'Get%' and ROUTINE_TYPE = 'PROCEDURE'\n"
-    cur.execute(queryString)
-    for proc in cur:
-        procNames.append(proc[0])
-
-def getProc(connection, procName):
-    cur = connection.cursor()
-    queryString = "select SPECIFIC_NAME \n" \
-                + "from INFORMATION_SCHEMA.Routines \n" \
-                + "where ROUTINE_NAME = '" + procName + "' and ROUTINE_TYPE = 'PROCEDURE'\n"
-    cur.execute(queryString)
+                + "where ROUTINE_NAME LIKE 'Get%%' and ROUTINE_TYPE = 'PROCEDURE'\n" \
+                + "and ROUTINE_SCHEMA = %s \n"
+    cur.execute(queryString, (generationOptions['schema'],))
     for proc in cur:
         procNames.append(proc[0])
 
@@ -134,280 +544,1151 @@ def getTables(connection):
     cur = connection.cursor()
     queryString = "select TABLE_NAME \n" \
                   + "from INFORMATION_SCHEMA.Tables \n" \
-                  + "where TABLE_SCHEMA = 'dbo' and TABLE_TYPE = 'BASE TABLE'"
-    cur.execute(queryString)
-    for table in cur:
-        tableNames.append(table[0])
-
-def getTable(connection, tableName):
-    cur = connection.cursor()
-    queryString = "select TABLE_NAME \n" \
-                  + "from INFORMATION_SCHEMA.Tables \n" \
-                  + "where TABLE_SCHEMA = 'dbo' and TABLE_TYPE = 'BASE TABLE' and TABLE_NAME = '" + tableName + "'"
-    cur.execute(queryString)
+                  + "where TABLE_SCHEMA = %s and TABLE_TYPE = 'BASE TABLE'"
+    cur.execute(queryString, (generationOptions['schema'],))
     for table in cur:
         tableNames.append(table[0])
 
-def getTablesStartingWith(connection, sequence):
-    cur = connection.cursor()
-    queryString = "select TABLE_NAME \n" \
-                  + "from INFORMATION_SCHEMA.Tables \n" \
-                  + "where TABLE_SCHEMA = 'dbo' and TABLE_TYPE = 'BASE TABLE' and TABLE_NAME LIKE '" + sequence + "%'"
-    cur.execute(queryString)
-    for table in cur:
-        tableNames.append(table[0])
+# object selection, narrowing the discovered tableNames and procNames for targeted runs
+catalogForeignKeyEdgesQuery = "select object_name(fk.parent_object_id), object_name(fk.referenced_object_id) \n" \
+                              + "from sys.foreign_keys fk \n" \
+                              + "where fk.schema_id = schema_id(%s) \n" \
+                              + "and fk.referenced_object_id in (select object_id from sys.tables where schema_id = fk.schema_id) \n"
+
+# procedures name the tables they use, unqualified names resolve to the procedure's own schema
+catalogReferencingProcsQuery = "select distinct p.name \n" \
+                               + "from sys.sql_expression_dependencies d \n" \
+                               + "join sys.procedures p on p.object_id = d.referencing_id \n" \
+                               + "where p.schema_id = schema_id(%s) \n" \
+                               + "and coalesce(d.referenced_schema_name, schema_name(p.schema_id)) = %s \n" \
+                               + "and d.referenced_entity_name in %s \n"
+
+def matchesAny(objectName, patterns):
+    return any(fnmatch.fnmatchcase(objectName, pattern) for pattern in patterns)
+
+def foreignKeyClosure(connection, selectedTables):
+    # the selected tables plus every table they reference, directly or through other tables
+    referencedTables = {}
+    for tableName, referencedTable in fetchRows(connection, catalogForeignKeyEdgesQuery, (generationOptions['schema'],)):
+        referencedTables.setdefault(tableName, []).append(referencedTable)
+    closure = set(selectedTables)
+    pendingTables = list(selectedTables)
+    while len(pendingTables) != 0:
+        for referencedTable in referencedTables.get(pendingTables.pop(), []):
+            if referencedTable not in closure:
+                closure.add(referencedTable)
+                pendingTables.append(referencedTable)
+    return closure
+
+def referencingProcs(connection, selectedTables):
+    if len(selectedTables) == 0:
+        return set()
+    params = (generationOptions['schema'], generationOptions['schema'], tuple(selectedTables))
+    return set(row[0] for row in fetchRows(connection, catalogReferencingProcsQuery, params))
+
+def selectObjects(connection, includePatterns, excludePatterns, withDependencies):
+    # keeps the discovered objects matching an include pattern (all of them without one), optionally adding
+    # the foreign key closure of the selected tables and the procedures using them; exclude patterns always win
+    selectedTables = set(tableName for tableName in tableNames if len(includePatterns) == 0 or matchesAny(tableName, includePatterns))
+    selectedProcs = set(procName for procName in procNames if len(includePatterns) == 0 or matchesAny(procName, includePatterns))
+    if withDependencies:
+        selectedTables = foreignKeyClosure(connection, selectedTables)
+        selectedProcs |= referencingProcs(connection, selectedTables)
+    tableNames[:] = [tableName for tableName in tableNames if tableName in selectedTables and not matchesAny(tableName, excludePatterns)]
+    procNames[:] = [procName for procName in procNames if procName in selectedProcs and not matchesAny(procName, excludePatterns)]
+
+def selectionRequested(arguments):
+    return len(arguments.include) != 0 or len(arguments.exclude) != 0
+
+def objectSelection(arguments):
+    # the object names a selective run covers, None when it covers them all; a covered object the run
+    # doesn't discover any more was dropped from the database
+    if not selectionRequested(arguments):
+        return None
+    return lambda objectName : ((len(arguments.include) == 0 or matchesAny(objectName, arguments.include))
+                                and not matchesAny(objectName, arguments.exclude))
 
 def tableHasIdentity(tableName, connection):
     cur = connection.cursor()
-    queryString = "select objectproperty(object_id('" + tableName + "'), 'TableHasIdentity')"
-    cur.execute(queryString)
+    queryString = "select objectproperty(object_id(%s + '.' + %s), 'TableHasIdentity')"
+    cur.execute(queryString, (generationOptions['schema'], tableName))
     for proc in cur:
         return proc[0] == 1
     return False
 
+def getProcResultColumns(procName, connection):
+    cur = connection.cursor()
+    queryString = "select name, type_name(system_type_id), case when is_nullable = 1 then 'YES' else 'NO' end \n" \
+                + "from sys.dm_exec_describe_first_result_set_for_object(object_id(%s + '.' + %s), 0) \n" \
+                + "where is_hidden = 0 \n" \
+                + "and error_number is null \n" \
+                + "order by column_ordinal \n"
+    cur.execute(queryString, (generationOptions['schema'], procName))
+    return cur
+
 def getIdentityColumn(tableName, connection):
     cur = connection.cursor()
     queryString = "select COLUMN_NAME \n" \
                   + "from INFORMATION_SCHEMA.COLUMNS \n" \
-                  + "where COLUMNPROPERTY(object_id(TABLE_NAME), COLUMN_NAME, 'IsIdentity') = 1 \n"\
-                  + "and TABLE_SCHEMA = 'dbo'\n" \
-                  + "and TABLE_NAME = '" + tableName + "'\n"
-    cur.execute(queryString)
+                  + "where COLUMNPROPERTY(object_id(TABLE_SCHEMA + '.' + TABLE_NAME), COLUMN_NAME, 'IsIdentity') = 1 \n"\
+                  + "and TABLE_SCHEMA = %s\n" \
+                  + "and TABLE_NAME = %s\n"
+    cur.execute(queryString, (generationOptions['schema'], tableName))
     for proc in cur:
         return proc[0]
     return ''
 
-def compareTableWithGetProc(connection, tableName):
-    proc = getProc(connection, 'Get' + tableName)
-    table = getTable(connection, tableName)
-
 def getTableColumns(connection, tableName):
     cur = connection.cursor()
     queryString = "select COLUMN_NAME, DATA_TYPE, IS_NULLABLE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE \n" \
                   + "from INFORMATION_SCHEMA.COLUMNS \n" \
-                  + "where TABLE_NAME = '" + tableName + "' \n" + "and TABLE_SCHEMA = 'dbo' \n"
-    cur.execute(queryString)
+                  + "where TABLE_NAME = %s \n" + "and TABLE_SCHEMA = %s \n" \
+                  + "order by ORDINAL_POSITION \n"
+    cur.execute(queryString, (tableName, generationOptions['schema']))
     return cur.fetchall()
 
 def getTableConstraints(connection, tableName, constraintType):
     cur = connection.cursor()
-    queryString = "select kcu.TABLE_NAME, kcu.COLUMN_NAME, cts.CONSTRAINT_TYPE, c.DATA_TYPE, c.IS_NULLABLE \n" \
+    queryString = "select kcu.TABLE_NAME, kcu.COLUMN_NAME, cts.CONSTRAINT_TYPE, c.DATA_TYPE, c.IS_NULLABLE, object_name(fk.referenced_object_id) \n" \
                   + "from INFORMATION_SCHEMA.TABLE_CONSTRAINTS cts, INFORMATION_SCHEMA.KEY_COLUMN_USAGE kcu \n" \
                   + "join INFORMATION_SCHEMA.COLUMNS c on c.COLUMN_NAME = kcu.COLUMN_NAME \n" \
                   + "and c.TABLE_NAME = kcu.TABLE_NAME \n" \
                   + "and c.TABLE_SCHEMA = kcu.TABLE_SCHEMA \n" \
-                  + "where cts.TABLE_NAME = '" + tableName + "' \n" \
+                  + "left join sys.foreign_keys fk on fk.name = kcu.CONSTRAINT_NAME \n" \
+                  + "and fk.schema_id = schema_id(kcu.CONSTRAINT_SCHEMA) \n" \
+                  + "where cts.TABLE_NAME = %s \n" \
                   + "and cts.TABLE_NAME = kcu.TABLE_NAME \n" \
-                  + "and cts.TABLE_SCHEMA = 'dbo' \n" \
+                  + "and cts.TABLE_SCHEMA = %s \n" \
+                  + "and cts.TABLE_SCHEMA = kcu.TABLE_SCHEMA \n" \
                   + "and cts.CONSTRAINT_NAME = kcu.CONSTRAINT_NAME \n" \
                   + "and c.COLUMN_NAME = kcu.COLUMN_NAME \n" \
-                  + "and cts.CONSTRAINT_TYPE = '" + constraintType.upper() + "' \n"
-    cur.execute(queryString)
+                  + "and cts.CONSTRAINT_TYPE = %s \n" \
+                  + "order by kcu.ORDINAL_POSITION \n"
+    cur.execute(queryString, (tableName, generationOptions['schema'], constraintType.upper()))
     return cur.fetchall()
 
-def createColumnDefinition(col, tableName, tableConstraints, connection):
-    # get column name only, primary key can have null (allows insert)
-    tableConstraints = map((lambda row : row[1]), tableConstraints)
-    isNullColumn = ("NULL" if (col[2] == "YES" or col[0] in tableConstraints) else "NOT NULL")
+# catalog snapshot queries, each one reads the whole schema in a single round trip
+catalogColumnsQuery = "select TABLE_NAME, COLUMN_NAME, DATA_TYPE, IS_NULLABLE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE, \n" \
+                      + "COLUMNPROPERTY(object_id(TABLE_SCHEMA + '.' + TABLE_NAME), COLUMN_NAME, 'IsIdentity') \n" \
+                      + "from INFORMATION_SCHEMA.COLUMNS \n" \
+                      + "where TABLE_SCHEMA = %s \n" \
+                      + "order by TABLE_NAME, ORDINAL_POSITION \n"
+
+# the last column is the table a foreign key references, null for primary keys
+catalogConstraintsQuery = "select kcu.TABLE_NAME, kcu.COLUMN_NAME, cts.CONSTRAINT_TYPE, c.DATA_TYPE, c.IS_NULLABLE, object_name(fk.referenced_object_id) \n" \
+                          + "from INFORMATION_SCHEMA.TABLE_CONSTRAINTS cts, INFORMATION_SCHEMA.KEY_COLUMN_USAGE kcu \n" \
+                          + "join INFORMATION_SCHEMA.COLUMNS c on c.COLUMN_NAME = kcu.COLUMN_NAME \n" \
+                          + "and c.TABLE_NAME = kcu.TABLE_NAME \n" \
+                          + "and c.TABLE_SCHEMA = kcu.TABLE_SCHEMA \n" \
+                          + "left join sys.foreign_keys fk on fk.name = kcu.CONSTRAINT_NAME \n" \
+                          + "and fk.schema_id = schema_id(kcu.CONSTRAINT_SCHEMA) \n" \
+                          + "where cts.TABLE_NAME = kcu.TABLE_NAME \n" \
+                          + "and cts.TABLE_SCHEMA = %s \n" \
+                          + "and cts.TABLE_SCHEMA = kcu.TABLE_SCHEMA \n" \
+                          + "and cts.CONSTRAINT_NAME = kcu.CONSTRAINT_NAME \n" \
+                          + "and cts.CONSTRAINT_TYPE in ('PRIMARY KEY', 'FOREIGN KEY') \n" \
+                          + "order by kcu.TABLE_NAME, cts.CONSTRAINT_TYPE, kcu.ORDINAL_POSITION \n"
+
+catalogParametersQuery = "select SPECIFIC_NAME, PARAMETER_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, coalesce(NUMERIC_SCALE, DATETIME_PRECISION), \n" \
+                         + "USER_DEFINED_TYPE_SCHEMA + '.' + USER_DEFINED_TYPE_NAME \n" \
+                         + "from INFORMATION_SCHEMA.PARAMETERS \n" \
+                         + "where SPECIFIC_SCHEMA = %s \n" \
+                         + "and PARAMETER_MODE = 'IN' \n" \
+                         + "order by SPECIFIC_NAME, ORDINAL_POSITION \n"
+
+# first result set of every Get procedure, as SQL Server describes it without running the procedure;
+# procedures it can't describe (temp tables, dynamic SQL) report an error and keep the DataTable accessors
+catalogResultColumnsQuery = "select p.name, r.name, type_name(r.system_type_id), case when r.is_nullable = 1 then 'YES' else 'NO' end \n" \
+                            + "from sys.procedures p \n" \
+                            + "cross apply sys.dm_exec_describe_first_result_set_for_object(p.object_id, 0) r \n" \
+                            + "where p.schema_id = schema_id(%s) \n" \
+                            + "and p.name like 'Get%%' \n" \
+                            + "and r.is_hidden = 0 \n" \
+                            + "and r.error_number is null \n" \
+                            + "order by p.name, r.column_ordinal \n"
+
+# run profile: wall time per stage, catalog query counts and per-object timings, written out by --profile
+profileStages = ['catalog discovery', 'metadata fetch', 'table type emission', 'merge emission', 'setter emission',
+                 'accessor emission', 'controller emission', 'file writes']
+
+def createRunProfile():
+    return { 'stages' : dict((stageName, 0.0) for stageName in profileStages), 'queries' : 0, 'rows' : 0,
+             'outputBytes' : {}, 'generatedCode' : None, 'compileSeconds' : None, 'objectSeconds' : { 'tables' : {}, 'procs' : {} } }
+
+runProfile = createRunProfile()
+runProfileLock = threading.Lock()
+
+def resetRunProfile():
+    global runProfile
+    runProfile = createRunProfile()
+
+def addStageTime(stageName, seconds):
+    with runProfileLock:
+        runProfile['stages'][stageName] = runProfile['stages'].get(stageName, 0.0) + seconds
+
+@contextlib.contextmanager
+def profileStage(stageName):
+    start = time.time()
+    try:
+        yield
+    finally:
+        addStageTime(stageName, time.time() - start)
+
+def mergeRunProfile(stages, objectSeconds):
+    # folds in the timings a process pool worker recorded for one object
+    for stageName, seconds in stages.items():
+        addStageTime(stageName, seconds)
+    for objectType, timings in objectSeconds.items():
+        runProfile['objectSeconds'][objectType].update(timings)
+
+def recordOutputBytes(fileName, byteCount):
+    runProfile['outputBytes'][fileName] = byteCount
+
+class ProfiledCursor(object):
+    # counts the queries executed and rows read through a pymssql cursor
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, *args):
+        with runProfileLock:
+            runProfile['queries'] += 1
+        return self.cursor.execute(*args)
+
+    def countRows(self, rowCount):
+        with runProfileLock:
+            runProfile['rows'] += rowCount
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            self.countRows(1)
+        return row
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self.countRows(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self.cursor:
+            self.countRows(1)
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+class ProfiledConnection(object):
+    def __init__(self, connection):
+        self.connection = connection
+
+    def cursor(self, *args, **kwargs):
+        return ProfiledCursor(self.connection.cursor(*args, **kwargs))
+
+    def __enter__(self):
+        self.connection.__enter__()
+        return self
+
+    def __exit__(self, *exceptionInfo):
+        return self.connection.__exit__(*exceptionInfo)
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+def writeProfileReport(profilePath, totalSeconds, slowestCount):
+    report = { 'totalSeconds' : round(totalSeconds, 6),
+               'stages' : dict((stageName, round(seconds, 6)) for stageName, seconds in runProfile['stages'].items()),
+               'catalogQueries' : runProfile['queries'],
+               'catalogRows' : runProfile['rows'],
+               'outputBytes' : runProfile['outputBytes'],
+               'generatedCode' : runProfile['generatedCode'],
+               'compileSeconds' : runProfile['compileSeconds'] }
+    for objectType, reportKey in (('tables', 'slowestTables'), ('procs', 'slowestProcs')):
+        timings = sorted(runProfile['objectSeconds'][objectType].items(), key=lambda timing : timing[1], reverse=True)
+        report[reportKey] = [{ 'name' : objectName, 'seconds' : round(seconds, 6) } for objectName, seconds in timings[:slowestCount]]
+    with open(profilePath, 'w') as profileFile:
+        json.dump(report, profileFile, indent=4)
+
+# quiet progress in place of one line per object, which is slow on a Windows console
+progressInterval = 0.5
+lastProgressTime = 0.0
+
+def reportProgress(label, done, total):
+    # rewrites a single status line at most every progressInterval seconds, ending it once done
+    global lastProgressTime
+    now = time.time()
+    if done < total and now - lastProgressTime < progressInterval:
+        return
+    lastProgressTime = now
+    sys.stdout.write('\r' + label + ': ' + str(done) + '/' + str(total) + ('\n' if done >= total else ''))
+    sys.stdout.flush()
+
+def fetchRows(connection, queryString, params = None):
+    cur = connection.cursor()
+    cur.execute(queryString, params)
+    return cur.fetchall()
+
+# above this many names a restricted catalog query reads the whole schema and drops the other rows
+# client side instead: a long literal in (...) list is slower than the plain schema query and, in
+# the tens of thousands, fails to compile on the server (errors 8623/8632)
+filteredQueryNameLimit = 500
+
+def filterCatalogQuery(queryString, nameColumn):
+    # restricts a catalog query to the object names passed as its last query parameter
+    whereString, orderByString = queryString.split('order by ')
+    return whereString + 'and ' + nameColumn + ' in %s \n' + 'order by ' + orderByString
+
+# catalog model; __slots__ keeps each record small enough to hold very large catalogs in memory
+class Column(object):
+    __slots__ = ('name', 'dataType', 'isNullable', 'maximumLength', 'precision', 'scale')
+
+    def __init__(self, name, dataType, isNullable, maximumLength, precision, scale):
+        self.name = name
+        self.dataType = sys.intern(dataType)
+        self.isNullable = isNullable == 'YES'
+        self.maximumLength = maximumLength
+        self.precision = precision
+        self.scale = scale
+
+    def toRow(self):
+        return (self.name, self.dataType, 'YES' if self.isNullable else 'NO', self.maximumLength, self.precision, self.scale)
+
+class Key(object):
+    __slots__ = ('columnName', 'constraintType', 'dataType', 'isNullable', 'referencedTable')
+
+    def __init__(self, columnName, constraintType, dataType, isNullable, referencedTable):
+        self.columnName = columnName
+        self.constraintType = sys.intern(constraintType)
+        self.dataType = sys.intern(dataType)
+        self.isNullable = isNullable == 'YES'
+        self.referencedTable = referencedTable
+
+    def toRow(self, tableName):
+        return (tableName, self.columnName, self.constraintType, self.dataType, 'YES' if self.isNullable else 'NO', self.referencedTable)
+
+class ProcParameter(object):
+    __slots__ = ('name', 'dataType', 'maximumLength', 'precision', 'scale', 'typeName')
+
+    def __init__(self, name, dataType, maximumLength, precision, scale, typeName):
+        self.name = name
+        self.dataType = sys.intern(dataType)
+        self.maximumLength = maximumLength
+        self.precision = precision
+        self.scale = scale
+        self.typeName = typeName
+
+    def toRow(self):
+        return (self.name, self.dataType, self.maximumLength, self.precision, self.scale, self.typeName)
+
+class ResultColumn(object):
+    __slots__ = ('name', 'dataType', 'isNullable')
+
+    def __init__(self, name, dataType, isNullable):
+        self.name = name
+        self.dataType = sys.intern(dataType)
+        self.isNullable = isNullable == 'YES'
+
+    def toRow(self):
+        return (self.name, self.dataType, 'YES' if self.isNullable else 'NO')
+
+class Table(object):
+    # columnNames, keyColumnNames, joinColumnNames and skipUpdateColumnNames are worked out once
+    # here so the emitters never scan column or constraint lists
+    __slots__ = ('name', 'columns', 'primaryKeys', 'foreignKeys', 'identity',
+                 'columnNames', 'keyColumnNames', 'joinColumnNames', 'skipUpdateColumnNames')
+
+    def __init__(self, name, columns, primaryKeys, foreignKeys, identity):
+        self.name = name
+        self.columns = columns
+        self.primaryKeys = primaryKeys
+        self.foreignKeys = foreignKeys
+        self.identity = identity
+        self.columnNames = frozenset(column.name for column in columns)
+        self.keyColumnNames = frozenset(key.columnName for key in primaryKeys)
+        self.joinColumnNames = tuple([key.columnName for key in primaryKeys]
+                                     + [joinCol for joinCol in additionalJoinColumns if joinCol in self.columnNames and joinCol not in self.keyColumnNames])
+        self.skipUpdateColumnNames = frozenset([identity] + skipUpdateColumns + additionalJoinColumns)
+
+class Proc(object):
+    __slots__ = ('name', 'parameters', 'resultColumns')
+
+    def __init__(self, name, parameters, resultColumns):
+        self.name = name
+        self.parameters = parameters
+        self.resultColumns = resultColumns
+
+def catalogObjectFromEntry(objectType, objectName, entry):
+    # entries are the plain row form used by the catalog queries, the cache and the manifest hashes
+    if objectType == 'tables':
+        return Table(objectName,
+                     [Column(*row) for row in entry['columns']],
+                     [Key(*row[1:]) for row in entry['primary key']],
+                     [Key(*row[1:]) for row in entry['foreign key']],
+                     entry['identity'])
+    return Proc(objectName, [ProcParameter(*row) for row in entry['parameters']],
+                [ResultColumn(*row) for row in entry['result columns']])
+
+def catalogObjectToEntry(objectType, catalogObject):
+    if objectType == 'tables':
+        return { 'columns' : [column.toRow() for column in catalogObject.columns],
+                 'primary key' : [key.toRow(catalogObject.name) for key in catalogObject.primaryKeys],
+                 'foreign key' : [key.toRow(catalogObject.name) for key in catalogObject.foreignKeys],
+                 'identity' : catalogObject.identity }
+    return { 'parameters' : [parameter.toRow() for parameter in catalogObject.parameters],
+             'result columns' : [column.toRow() for column in catalogObject.resultColumns] }
+
+@contextlib.contextmanager
+def garbageCollectionPaused():
+    # building hundreds of thousands of catalog records triggers repeated full collections
+    # that find nothing to free, pause the collector while a catalog is being built. The records
+    # live for the whole run, so they are then moved out of the collector's view for good
+    wasEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        gc.freeze()
+        if wasEnabled:
+            gc.enable()
+
+def catalogFromEntries(entries):
+    catalog = { 'tables' : {}, 'procs' : {} }
+    with garbageCollectionPaused():
+        for objectType in ('tables', 'procs'):
+            for objectName, entry in entries[objectType].items():
+                catalog[objectType][objectName] = catalogObjectFromEntry(objectType, objectName, entry)
+    return catalog
+
+def catalogMemoryUsage(catalog):
+    # approximate bytes held by the catalog, counting shared objects (interned strings, small ints) once
+    seenIds = set()
+    totalSize = 0
+    pending = [catalog]
+    while len(pending) != 0:
+        item = pending.pop()
+        if id(item) in seenIds:
+            continue
+        seenIds.add(id(item))
+        totalSize += sys.getsizeof(item)
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend(item)
+        elif hasattr(item, '__slots__'):
+            pending.extend(getattr(item, slot) for slot in item.__slots__)
+    return totalSize
+
+def printCatalogMemoryUsage(catalog):
+    columnCount = sum(len(table.columns) for table in catalog['tables'].values())
+    totalSize = catalogMemoryUsage(catalog)
+    print('Catalog memory: ' + str(totalSize) + ' bytes for ' + str(len(catalog['tables'])) + ' tables, '
+          + str(columnCount) + ' columns and ' + str(len(catalog['procs'])) + ' procedures'
+          + (' (' + str(totalSize // columnCount) + ' bytes per column)' if columnCount != 0 else ''))
+
+def createCatalogTable():
+    return { 'columns' : [], 'primary key' : [], 'foreign key' : [], 'identity' : '' }
+
+def createCatalogProc():
+    return { 'parameters' : [], 'result columns' : [] }
+
+def loadCatalog(connection, selectedTables = None, selectedProcs = None):
+    # loads everything the generators need for tableNames and procNames in a fixed number of queries,
+    # so the query count does not grow with the number of tables and procedures; passing
+    # selectedTables/selectedProcs restricts the catalog to just those objects, and the queries
+    # too as long as there are at most filteredQueryNameLimit of them
+    entries = { 'tables' : {}, 'procs' : {} }
+    for tableName in (tableNames if selectedTables is None else selectedTables):
+        entries['tables'][tableName] = createCatalogTable()
+    for procName in (procNames if selectedProcs is None else selectedProcs):
+        entries['procs'][procName] = createCatalogProc()
+
+    if len(entries['tables']) != 0:
+        columnsQuery = catalogColumnsQuery
+        constraintsQuery = catalogConstraintsQuery
+        params = (generationOptions['schema'],)
+        if selectedTables is not None and len(selectedTables) <= filteredQueryNameLimit:
+            columnsQuery = filterCatalogQuery(catalogColumnsQuery, 'TABLE_NAME')
+            constraintsQuery = filterCatalogQuery(catalogConstraintsQuery, 'kcu.TABLE_NAME')
+            params = (generationOptions['schema'], tuple(selectedTables))
+
+        for row in fetchRows(connection, columnsQuery, params):
+            table = entries['tables'].get(row[0])
+            if table is None:
+                continue
+            table['columns'].append(tuple(row[1:7]))
+            if row[7] == 1:
+                table['identity'] = row[1]
+
+        for row in fetchRows(connection, constraintsQuery, params):
+            table = entries['tables'].get(row[0])
+            if table is not None:
+                table[row[2].lower()].append(tuple(row))
+
+    if len(entries['procs']) != 0:
+        parametersQuery = catalogParametersQuery
+        params = (generationOptions['schema'],)
+        filtered = selectedProcs is not None and len(selectedProcs) <= filteredQueryNameLimit
+        if filtered:
+            parametersQuery = filterCatalogQuery(catalogParametersQuery, 'SPECIFIC_NAME')
+            params = (generationOptions['schema'], tuple(selectedProcs))
+
+        for row in fetchRows(connection, parametersQuery, params):
+            proc = entries['procs'].get(row[0])
+            if proc is not None:
+                proc['parameters'].append(tuple(row[1:]))
+
+        resultColumnsQuery = filterCatalogQuery(catalogResultColumnsQuery, 'p.name') if filtered else catalogResultColumnsQuery
+        for row in fetchRows(connection, resultColumnsQuery, params):
+            proc = entries['procs'].get(row[0])
+            if proc is not None:
+                proc['result columns'].append(tuple(row[1:]))
+
+    return catalogFromEntries(entries)
+
+class ConnectionPool(object):
+    # bounded pool of database connections, pymssql connections must not be shared between threads
+    def __init__(self, connect, size):
+        self.connect = connect
+        self.size = size
+        self.idleConnections = queue.Queue()
+        self.connectionCount = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.idleConnections.empty() and self.connectionCount < self.size:
+                self.connectionCount += 1
+                createConnection = True
+            else:
+                createConnection = False
+        if createConnection:
+            try:
+                return self.connect()
+            except Exception:
+                with self.lock:
+                    self.connectionCount -= 1
+                raise
+        return self.idleConnections.get()
+
+    def release(self, connection):
+        self.idleConnections.put(connection)
+
+    def close(self):
+        while not self.idleConnections.empty():
+            self.idleConnections.get().close()
+
+def createQueryStats():
+    # list.append is atomic, so the pool's threads record into these lists without a lock;
+    # the query count is the number of latencies recorded
+    return { 'latencies' : [], 'waits' : [] }
+
+def runPooledQuery(pool, queryStats, query, *args):
+    # runs query(connection, *args) on a pooled connection, recording the time spent waiting
+    # for a connection and the time the query itself took
+    waitStart = time.time()
+    connection = pool.acquire()
+    queryStart = time.time()
+    try:
+        result = query(connection, *args)
+        if not isinstance(result, (list, tuple, str)):
+            result = list(result)
+    finally:
+        pool.release(connection)
+    queryEnd = time.time()
+    queryStats['waits'].append(queryStart - waitStart)
+    queryStats['latencies'].append(queryEnd - queryStart)
+    return result
+
+def fetchCatalogPerObject(pool, selectedTables, selectedProcs, concurrency, queryStats):
+    # fallback for when the catalog can't be read in bulk: issues the per-object catalog queries,
+    # keeping at most concurrency of them in flight over the pool
+    entries = { 'tables' : {}, 'procs' : {} }
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        tableFutures = []
+        for tableName in selectedTables:
+            tableFutures.append((tableName,
+                                 executor.submit(runPooledQuery, pool, queryStats, getTableColumns, tableName),
+                                 executor.submit(runPooledQuery, pool, queryStats, getTableConstraints, tableName, 'primary key'),
+                                 executor.submit(runPooledQuery, pool, queryStats, getTableConstraints, tableName, 'foreign key'),
+                                 executor.submit(runPooledQuery, pool, queryStats, lambda connection, name : getIdentityColumn(name, connection), tableName)))
+        procFutures = []
+        for procName in selectedProcs:
+            procFutures.append((procName, executor.submit(runPooledQuery, pool, queryStats, lambda connection, name : getProcParameters(name, connection), procName),
+                                executor.submit(runPooledQuery, pool, queryStats, lambda connection, name : getProcResultColumns(name, connection), procName)
+                                if procName[:3].lower() == 'get' else None))
+
+        for tableName, columnsFuture, primaryKeysFuture, foreignKeysFuture, identityFuture in tableFutures:
+            table = createCatalogTable()
+            table['columns'] = [tuple(row) for row in columnsFuture.result()]
+            table['primary key'] = [tuple(row) for row in primaryKeysFuture.result()]
+            table['foreign key'] = [tuple(row) for row in foreignKeysFuture.result()]
+            table['identity'] = identityFuture.result()
+            entries['tables'][tableName] = table
+        for procName, parametersFuture, resultColumnsFuture in procFutures:
+            proc = createCatalogProc()
+            proc['parameters'] = [tuple(row) for row in parametersFuture.result()]
+            if resultColumnsFuture is not None:
+                proc['result columns'] = [tuple(row) for row in resultColumnsFuture.result()]
+            entries['procs'][procName] = proc
+    return catalogFromEntries(entries)
+
+def percentile(values, fraction):
+    orderedValues = sorted(values)
+    return orderedValues[min(len(orderedValues) - 1, int(len(orderedValues) * fraction))]
+
+def printQueryStats(queryStats, concurrency):
+    queryCount = len(queryStats['latencies'])
+    if queryCount == 0:
+        return
+    print('Pooled catalog queries: ' + str(queryCount) + ' at concurrency ' + str(concurrency)
+          + ', latency avg ' + '%.1f' % (1000 * sum(queryStats['latencies']) / queryCount)
+          + 'ms p95 ' + '%.1f' % (1000 * percentile(queryStats['latencies'], 0.95))
+          + 'ms max ' + '%.1f' % (1000 * max(queryStats['latencies']))
+          + 'ms, pool wait avg ' + '%.1f' % (1000 * sum(queryStats['waits']) / queryCount)
+          + 'ms max ' + '%.1f' % (1000 * max(queryStats['waits'])) + 'ms')
+
+# modification stamps used to invalidate the metadata cache; a procedure is also stale when
+# one of the table types it takes as a parameter (sys.types/sys.table_types) was recreated, or
+# when an object it references was altered, since that can change its described result set
+catalogModifyDatesQuery = "select o.name, o.type, convert(varchar(23), o.modify_date, 126), \n" \
+                          + "convert(varchar(23), (select max(tto.modify_date) \n" \
+                          + "\tfrom sys.parameters p \n" \
+                          + "\tjoin sys.table_types tt on tt.user_type_id = p.user_type_id \n" \
+                          + "\tjoin sys.objects tto on tto.object_id = tt.type_table_object_id \n" \
+                          + "\twhere p.object_id = o.object_id), 126), \n" \
+                          + "convert(varchar(23), (select max(ro.modify_date) \n" \
+                          + "\tfrom sys.sql_expression_dependencies d \n" \
+                          + "\tjoin sys.objects ro on ro.object_id = d.referenced_id \n" \
+                          + "\twhere d.referencing_id = o.object_id), 126) \n" \
+                          + "from sys.objects o \n" \
+                          + "where o.schema_id = schema_id(%s) \n" \
+                          + "and o.type in ('U', 'P') \n"
+
+cacheObjectTypes = { 'U' : 'tables', 'P' : 'procs' }
+
+def fetchModifyDates(connection, selectedNames = None):
+    # selectedNames limits the lookup to those objects, for runs generating a selection
+    modifyDates = { 'tables' : {}, 'procs' : {} }
+    queryString = catalogModifyDatesQuery
+    params = (generationOptions['schema'],)
+    if selectedNames is not None:
+        if len(selectedNames) == 0:
+            return modifyDates
+        if len(selectedNames) <= filteredQueryNameLimit:
+            queryString = catalogModifyDatesQuery + "and o.name in %s \n"
+            params = (generationOptions['schema'], tuple(selectedNames))
+    selected = set(selectedNames) if selectedNames is not None else None
+    for row in fetchRows(connection, queryString, params):
+        if selected is not None and row[0] not in selected:
+            continue
+        modifyDates[cacheObjectTypes[row[1].strip()]][row[0]] = '|'.join([row[2]] + [stamp or '' for stamp in row[3:]]).rstrip('|')
+    return modifyDates
+
+# bumped whenever the cached entry layout changes, older caches are emptied rather than misread
+metadataCacheVersion = 6
+
+def openMetadataCache(cachePath):
+    cache = sqlite3.connect(cachePath)
+    if cache.execute('pragma user_version').fetchone()[0] != metadataCacheVersion:
+        cache.execute('drop table if exists metadata')
+        cache.execute('pragma user_version = ' + str(metadataCacheVersion))
+    cache.execute("create table if not exists metadata ( \n"
+                  + "\tdatabaseName text not null, \n"
+                  + "\tobjectType text not null, \n"
+                  + "\tobjectName text not null, \n"
+                  + "\tmodifyDate text not null, \n"
+                  + "\tpayload text not null, \n"
+                  + "\tpayloadHash text not null, \n"
+                  + "\tprimary key (databaseName, objectType, objectName))")
+    return cache
+
+def loadCachedCatalog(connection, cachePath, databaseName, fetchSelected = None, selectedOnly = False):
+    # warm runs only fetch the tables and procedures whose modify date moved since they were cached;
+    # selectedOnly runs only look at the modify dates of tableNames and procNames
+    cacheStats = { 'hits' : 0, 'misses' : 0, 'stale' : 0, 'evicted' : 0 }
+    modifyDates = fetchModifyDates(connection, tableNames + procNames if selectedOnly else None)
+    cache = openMetadataCache(cachePath)
+    try:
+        cachedEntries = { 'tables' : {}, 'procs' : {} }
+        for objectType, objectName, modifyDate, payload, entryHash in cache.execute(
+                'select objectType, objectName, modifyDate, payload, payloadHash from metadata where databaseName = ?', (databaseName,)):
+            cachedEntries[objectType][objectName] = (modifyDate, payload, entryHash)
+
+        catalog = { 'tables' : {}, 'procs' : {} }
+        objectHashes = { 'tables' : {}, 'procs' : {} }
+        refetchNames = { 'tables' : [], 'procs' : [] }
+        with garbageCollectionPaused():
+            for objectType, objectNames in (('tables', tableNames), ('procs', procNames)):
+                for objectName in objectNames:
+                    cachedEntry = cachedEntries[objectType].get(objectName)
+                    if cachedEntry is None:
+                        cacheStats['misses'] += 1
+                        refetchNames[objectType].append(objectName)
+                    elif cachedEntry[0] != modifyDates[objectType].get(objectName):
+                        cacheStats['stale'] += 1
+                        refetchNames[objectType].append(objectName)
+                    else:
+                        cacheStats['hits'] += 1
+                        catalog[objectType][objectName] = catalogObjectFromEntry(objectType, objectName, json.loads(cachedEntry[1]))
+                        objectHashes[objectType][objectName] = cachedEntry[2]
+
+        if len(refetchNames['tables']) != 0 or len(refetchNames['procs']) != 0:
+            fetchedCatalog = (fetchSelected or (lambda selectedTables, selectedProcs : loadCatalog(connection, selectedTables, selectedProcs)))(
+                refetchNames['tables'], refetchNames['procs'])
+            for objectType in ('tables', 'procs'):
+                for objectName, catalogObject in fetchedCatalog[objectType].items():
+                    catalog[objectType][objectName] = catalogObject
+                    payload = json.dumps(catalogObjectToEntry(objectType, catalogObject))
+                    objectHashes[objectType][objectName] = payloadHash(payload)
+                    cache.execute('insert or replace into metadata values (?, ?, ?, ?, ?, ?)',
+                                  (databaseName, objectType, objectName, modifyDates[objectType].get(objectName, ''),
+                                   payload, objectHashes[objectType][objectName]))
+
+        # forget objects that no longer exist in the database, which a selective run can't tell
+        for objectType in ('tables', 'procs'):
+            for objectName in cachedEntries[objectType]:
+                if not selectedOnly and objectName not in modifyDates[objectType]:
+                    cacheStats['evicted'] += 1
+                    cache.execute('delete from metadata where databaseName = ? and objectType = ? and objectName = ?',
+                                  (databaseName, objectType, objectName))
+        cache.commit()
+    finally:
+        cache.close()
+
+    # keep generation order identical to the uncached path
+    catalog['tables'] = dict((tableName, catalog['tables'][tableName]) for tableName in tableNames)
+    catalog['procs'] = dict((procName, catalog['procs'][procName]) for procName in procNames)
+    catalog['hashes'] = objectHashes
+    return catalog, cacheStats
+
+def printCacheStats(cacheStats):
+    print('Metadata cache: ' + str(cacheStats['hits']) + ' hits, ' + str(cacheStats['misses']) + ' misses, '
+          + str(cacheStats['stale']) + ' stale, ' + str(cacheStats['evicted']) + ' evicted')
+
+# offline catalog snapshots: every field of every table/procedure entry is stored column-wise
+# (one tuple per row position, plus the row each object starts at) so a pickle load is a handful of big
+# tuples, and each table or procedure is only built from them when generation first looks it up
+snapshotFormat = 'ScriptDB catalog snapshot 6'
+
+def writeSnapshot(snapshotPath, catalog, databaseName):
+    snapshot = { 'format' : snapshotFormat, 'database' : databaseName, 'schema' : generationOptions['schema'],
+                 'tableNames' : list(tableNames), 'procNames' : list(procNames), 'tables' : {}, 'procs' : {} }
+    for objectType, objectNames in (('tables', tableNames), ('procs', procNames)):
+        fields = {}
+        for objectName in objectNames:
+            entry = catalogObjectToEntry(objectType, catalog[objectType][objectName])
+            for field, value in entry.items():
+                if isinstance(value, list):
+                    storedField = fields.setdefault(field, { 'starts' : [0], 'rows' : [] })
+                    storedField['rows'].extend(value)
+                    storedField['starts'].append(len(storedField['rows']))
+                else:
+                    fields.setdefault(field, { 'values' : [] })['values'].append(value)
+        # tuples rather than lists, the collector stops tracking tuples that only hold strings and numbers,
+        # where it would walk every list in full on each collection while the loaded objects are built
+        for storedField in fields.values():
+            if 'rows' in storedField:
+                storedField['columns'] = tuple(zip(*storedField.pop('rows')))
+                storedField['starts'] = tuple(storedField['starts'])
+            else:
+                storedField['values'] = tuple(storedField['values'])
+        snapshot[objectType] = fields
+    temporaryPath = snapshotPath + '.tmp'
+    with open(temporaryPath, 'wb') as snapshotFile:
+        pickle.dump(snapshot, snapshotFile, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporaryPath, snapshotPath)
+
+class SnapshotObjects(collections.abc.MutableMapping):
+    # a snapshot's tables or procedures left in the snapshot's columnar form, each object is only built
+    # the first time it is looked up, so loading a snapshot costs little more than unpickling it
+    __slots__ = ('objectType', 'fields', 'positions', 'objects')
+
+    def __init__(self, objectType, objectNames, fields):
+        self.objectType = objectType
+        self.fields = [(field, storedField.get('values'), storedField.get('columns'), storedField.get('starts'))
+                       for field, storedField in fields.items()]
+        self.positions = dict((objectName, index) for index, objectName in enumerate(objectNames))
+        self.objects = {}
+
+    def __getitem__(self, objectName):
+        catalogObject = self.objects.get(objectName)
+        if catalogObject is not None:
+            return catalogObject
+        index = self.positions[objectName]
+        entry = {}
+        for field, values, columns, starts in self.fields:
+            if values is not None:
+                entry[field] = values[index]
+                continue
+            start = starts[index]
+            end = starts[index + 1]
+            entry[field] = zip(*[column[start:end] for column in columns]) if end != start else ()
+        catalogObject = self.objects[objectName] = catalogObjectFromEntry(self.objectType, objectName, entry)
+        return catalogObject
+
+    def __setitem__(self, objectName, catalogObject):
+        # objects set after loading, e.g. by a refresh, take the place of the snapshot's
+        self.objects[objectName] = catalogObject
+        self.positions.setdefault(objectName, None)
+
+    def __delitem__(self, objectName):
+        del self.positions[objectName]
+        self.objects.pop(objectName, None)
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+def loadSnapshot(snapshotPath):
+    # replaces tableNames/procNames and the schema with the snapshot's and returns its catalog, no database needed
+    with open(snapshotPath, 'rb') as snapshotFile, garbageCollectionPaused():
+        snapshot = pickle.load(snapshotFile)
+    if not isinstance(snapshot, dict) or snapshot.get('format') != snapshotFormat:
+        raise ValueError(snapshotPath + ' is not a ' + snapshotFormat + ' file')
+    tableNames[:] = snapshot['tableNames']
+    procNames[:] = snapshot['procNames']
+    generationOptions['schema'] = snapshot['schema']
+
+    with garbageCollectionPaused():
+        catalog = dict((objectType, SnapshotObjects(objectType, objectNames, snapshot[objectType]))
+                       for objectType, objectNames in (('tables', tableNames), ('procs', procNames)))
+    return catalog, snapshot['database']
+
+def catalogTable(catalog, tableName):
+    return catalog['tables'][tableName]
+
+def catalogTableColumns(catalog, tableName):
+    return catalog['tables'][tableName].columns
+
+def catalogTableConstraints(catalog, tableName, constraintType):
+    table = catalog['tables'][tableName]
+    return table.primaryKeys if constraintType.lower() == 'primary key' else table.foreignKeys
+
+def catalogIdentityColumn(catalog, tableName):
+    return catalog['tables'][tableName].identity
+
+def catalogProcParameters(catalog, procName):
+    return catalog['procs'][procName].parameters
+
+def buildDeploymentWaves(catalog):
+    # groups tableNames into waves whose foreign keys only reference tables in earlier waves (Kahn's
+    # algorithm, keeping catalog order within a wave); tables on or behind a foreign key cycle can't be
+    # ordered and go in a last wave of their own
+    position = dict((tableName, index) for index, tableName in enumerate(tableNames))
+    referencingTables = dict((tableName, []) for tableName in tableNames)
+    pendingCounts = {}
+    for tableName in tableNames:
+        referencedTables = set(key.referencedTable for key in catalog['tables'][tableName].foreignKeys
+                               if key.referencedTable in position and key.referencedTable != tableName)
+        pendingCounts[tableName] = len(referencedTables)
+        for referencedTable in referencedTables:
+            referencingTables[referencedTable].append(tableName)
+    waves = []
+    wave = [tableName for tableName in tableNames if pendingCounts[tableName] == 0]
+    while len(wave) != 0:
+        waves.append((wave, False))
+        nextWave = []
+        for tableName in wave:
+            for referencingTable in referencingTables[tableName]:
+                pendingCounts[referencingTable] -= 1
+                if pendingCounts[referencingTable] == 0:
+                    nextWave.append(referencingTable)
+        wave = sorted(nextWave, key=position.get)
+    cycleWave = [tableName for tableName in tableNames if pendingCounts[tableName] != 0]
+    if len(cycleWave) != 0:
+        waves.append((cycleWave, True))
+    return waves
+
+def catalogDerived(catalog, name, build):
+    # values worked out from the whole catalog once, for the generation plan, the manifest hashes and
+    # the emitters; refreshing the catalog drops them
+    derived = catalog.setdefault('derived', {})
+    if name not in derived:
+        derived[name] = build(catalog)
+    return derived[name]
+
+def catalogDeploymentWaves(catalog):
+    return catalogDerived(catalog, 'waves', buildDeploymentWaves)
+
+def createColumnDefinition(col, keyColumnNames):
+    # primary key can have null (allows insert)
+    isNullColumn = ("NULL" if (col.isNullable or col.name in keyColumnNames) else "NOT NULL")
     extendedTypeInformation = ''
-    if col[1] == 'nvarchar' or col[1] == 'varchar':
-        extendedTypeInformation += '(' + ('max' if str(col[3]) == '-1' else str(col[3])) + ')'
-    elif col[1] == 'decimal' or col[1] == 'numeric':
-        extendedTypeInformation += '(' + str(col[4]) + ', ' + str(col[5]) + ')'
-    return col[0] + " " + col[1] + extendedTypeInformation.strip() + " " + isNullColumn
-
-def createTableType(sqlStatementFile, tableName, tableCols, tableConstraints, connection):
-    print('Creating table type for: ' + tableName)
-    paramsString = ''
-    for col in tableCols:
-        paramsString += "\t" + createColumnDefinition(col, tableName, tableConstraints, connection) + commaNewLineDelim
-    paramsString = paramsString.rstrip(commaNewLineDelim)
-    sqlStatementFile.write('\n-- Table type for: ' + tableName + '\n')
-    sqlStatementFile.write("create type " + tableName + "Table" + " as table (\n")
-    sqlStatementFile.write(paramsString)
-    sqlStatementFile.write("\n)\ngo\n\n")
-
-def createMergeStatementOnTableType(sqlStatementFile, tableName, tableCols, tableConstraints, connection):
-    print('Creating merge statement for: ' + tableName)
+    if col.dataType in lengthTypes:
+        extendedTypeInformation += '(' + ('max' if str(col.maximumLength) == '-1' else str(col.maximumLength)) + ')'
+    elif col.dataType in precisionTypes:
+        extendedTypeInformation += '(' + str(col.precision) + ', ' + str(col.scale) + ')'
+    return col.name + " " + col.dataType + extendedTypeInformation.strip() + " " + isNullColumn
+
+def schemaPrefix():
+    # objects outside dbo are named with their schema in the generated SQL and command texts
+    return '' if generationOptions['schema'] == 'dbo' else generationOptions['schema'] + '.'
+
+def tableTypeIsKeyed(table):
+    # rows for new identity keyed records arrive without a key, so those types stay unkeyed
+    return generationOptions['keyedTableTypes'] and len(table.primaryKeys) != 0 and table.identity not in table.keyColumnNames
+
+def tableTypeFragments(tableName, tableCols, tableConstraints, catalog):
+    table = catalogTable(catalog, tableName)
+    isKeyed = tableTypeIsKeyed(table)
+    isMemoryOptimized = isKeyed and generationOptions['memoryOptimized'] and not any(col.dataType in largeObjectTypes for col in tableCols)
+    keyDefinition = ''
+    if isKeyed:
+        keyDefinition = commaNewLineDelim + '\tprimary key ' + ('nonclustered ' if isMemoryOptimized else '') \
+                        + parenthesize(commaDelim.join(key.columnName for key in tableConstraints))
+    return renderTemplate('tableType', {
+        'tableName' : tableName,
+        'schemaPrefix' : schemaPrefix(),
+        # a keyed type declares its key columns as they are in the table, not nullable
+        'columnDefinitions' : delimited(("\t" + createColumnDefinition(col, frozenset() if isKeyed else table.keyColumnNames) for col in tableCols), commaNewLineDelim),
+        'keyDefinition' : keyDefinition,
+        'tableOptions' : '\nwith (memory_optimized = on)' if isMemoryOptimized else ''
+        })
+
+def createTableType(sqlStatementFile, tableName, tableCols, tableConstraints, catalog):
+    with profileStage('table type emission'):
+        fragments = list(tableTypeFragments(tableName, tableCols, tableConstraints, catalog))
+    writeFragments(sqlStatementFile, fragments)
+
+def mergeSourceContext(tableName, staging):
+    # the table valued parameter of Set<Table>, or the session's staging table filled by bulk copy
+    if staging:
+        return { 'procName' : schemaPrefix() + 'Set' + tableName + 'FromStaging', 'sourceParameter' : '', 'source' : stagingTableName(tableName),
+                 'schemaPrefix' : schemaPrefix(), 'mergeTitle' : 'Staging merge statement' }
+    return { 'procName' : schemaPrefix() + 'Set' + tableName, 'sourceParameter' : '\t@SourceTable ' + schemaPrefix() + tableName + 'Table readonly\n',
+             'source' : '@SourceTable', 'schemaPrefix' : schemaPrefix(), 'mergeTitle' : 'Merge statement' }
+
+def mergeStatementFragments(tableName, tableCols, tableConstraints, catalog, staging = False):
     sourceTableAlias = 'source'
-    sourceTableVariableName = '@' + sourceTableAlias[0].upper() + sourceTableAlias[1:] + "Table"
-    tableTypeName = tableName + "Table"
     targetTableAlias = 'target'
 
-    tableColNames = list(map((lambda row : row[0]), tableCols))
-    tableConstraintNames = list(map((lambda row : row[1]), tableConstraints))
+    if len(tableConstraints) == 0:
+        return renderTemplate('mergeProcWithoutKey', { 'tableName' : tableName })
 
-    mergeString = ''
-    mergeString += '\n-- Merge statement for: ' + tableName + '\n'
-    mergeString += "create procedure Set" + tableName + "\n"
-    mergeString += "\t" + sourceTableVariableName + " " + tableTypeName + " readonly\n" + "as\n" + "begin\n"
+    table = catalogTable(catalog, tableName)
 
     """ if tableHasIdentity(tableName, connection):
         sqlStatementFile.write("\tset IDENTITY_INSERT " + tableName + " on;\n") """
 
-    mergeString += "\tmerge " + tableName + " as " + targetTableAlias + '\n'
-    mergeString += "\tusing " + sourceTableVariableName + " as " + sourceTableAlias + '\n'
-
-    joinColumnString = ' '
-    firstColumn = True
-
-    identityColumnName = getIdentityColumn(tableName, connection)
-    
-    if len(tableConstraints) == 0:
-        mergeString = '-- Merge statement could not be written for ' + tableName \
-                      + ' as it\n-- contains no primary key columns for comparison in the \'on\' statement. \n'
-        sqlStatementFile.write(mergeString)
+    identityColumn = catalogIdentityColumn(catalog, tableName)
+    insertColNames = [targetCol.name for targetCol in tableCols if targetCol.name != identityColumn]
+
+    sourceContext = mergeSourceContext(tableName, staging)
+    if generationOptions['mergeMode'] != 'full':
+        return deltaMergeStatementFragments(tableName, tableCols, tableConstraints, table, insertColNames, sourceContext)
+
+    return renderTemplate('mergeProc', dict(sourceContext, **{
+        'tableName' : tableName,
+        'joinConditions' : (("\t\ton " if index == 0 else "\t\tand ") + sourceTableAlias + "." + joinCol + " = " + targetTableAlias + "." + joinCol + '\n'
+                            for index, joinCol in enumerate(table.joinColumnNames)),
+        'updateAssignments' : delimited(("\t\t" + targetCol.name + " = " + sourceTableAlias + "." + targetCol.name for targetCol in tableCols
+                                         if targetCol.name not in table.skipUpdateColumnNames), commaNewLineDelim),
+        'insertColumns' : delimited(("\t\t\t" + colName for colName in insertColNames), commaNewLineDelim),
+        'insertValues' : delimited(("\t\t\t" + sourceTableAlias + "." + colName for colName in insertColNames), commaNewLineDelim)
+        }))
+
+def matchedClauseFragments(updateCols):
+    # rows whose values are all unchanged are skipped instead of rewritten; except treats nulls as
+    # equal, it just can't compare large object columns so those tables always update matched rows
+    if len(updateCols) == 0:
         return
+    if not any(col.dataType in largeObjectTypes for col in updateCols):
+        yield '\twhen matched and exists (\n'
+        yield '\t\tselect ' + commaDelim.join('source.' + col.name for col in updateCols) + '\n'
+        yield '\t\texcept\n'
+        yield '\t\tselect ' + commaDelim.join('target.' + col.name for col in updateCols) + '\n'
+        yield '\t) then update set\n'
     else:
-        for tableConstraint in tableConstraintNames:
-            if firstColumn == True:
-                joinColumnString += "\t\ton "
-                firstColumn = False
-            else:
-                joinColumnString += "\t\tand "
-            joinColumnString += sourceTableAlias + "." + tableConstraint + " = " + targetTableAlias + "." + tableConstraint + '\n'
-        for joinCol in additionalJoinColumns:
-            if joinCol in tableColNames and joinCol not in tableConstraintNames:
-                if firstColumn == True:
-                    joinColumnString += "\t\ton "
-                    firstColumn = False
-                else:
-                    joinColumnString += "\t\tand "
-                joinColumnString += sourceTableAlias + "." + joinCol + " = " + targetTableAlias + "." + joinCol + '\n'
-
-    mergeString += joinColumnString
-    mergeString += "\twhen matched then update set\n"
-
-    updateCols = ''
-    for targetCol in tableCols:
-        if targetCol[0] != identityColumnName and targetCol[0] not in skipUpdateColumns and targetCol[0] not in additionalJoinColumns:
-            updateCols += "\t\t" + targetCol[0] + " = " + sourceTableAlias + "." + targetCol[0] + ", \n"
-
-    updateCols = updateCols.rstrip(", \n")
-    updateCols += '\n'
-
-    mergeString += updateCols
-    mergeString += "\twhen not matched by target then\n"
-
-    insertCols = ''
-    insertSourceCols = '';
-    for targetCol in tableCols:
-        if targetCol[0] != identityColumnName:
-            insertCols += "\t\t\t" + targetCol[0] + commaNewLineDelim
-            insertSourceCols += "\t\t\t" + sourceTableAlias + "." + targetCol[0] + commaNewLineDelim
-
-    insertCols = insertCols.rstrip(commaNewLineDelim)
-    insertSourceCols = insertSourceCols.rstrip(commaNewLineDelim)
-
-    mergeString += "\t\tinsert \n\t\t(\n" + insertCols + "\n\t\t)\n\t\tvalues\n\t\t(\n" + insertSourceCols + "\n\t\t)\n"
-    mergeString += "\twhen not matched by source then delete;\n"
-    mergeString += 'end;\ngo\n'
-
-    sqlStatementFile.write(mergeString)
+        yield '\twhen matched then update set\n'
+    yield from delimited(('\t\t' + col.name + ' = source.' + col.name for col in updateCols), commaNewLineDelim)
+    yield '\n'
+
+def deltaMergeStatementFragments(tableName, tableCols, tableConstraints, table, insertColNames, sourceContext):
+    # upsert never deletes; scoped only deletes target rows sharing a leading key value with the
+    # batch (the other lines of an order sent in full, say), so the work follows the batch size
+    mergeMode = generationOptions['mergeMode']
+    leadingKey = tableConstraints[0].columnName
+    targetScope = ''
+    if mergeMode == 'scoped':
+        targetScope = '\twith scopedTarget as (\n' \
+                      + '\t\tselect * from ' + schemaPrefix() + tableName + '\n' \
+                      + '\t\twhere ' + leadingKey + ' in (select ' + leadingKey + ' from ' + sourceContext['source'] + ')\n' \
+                      + '\t)\n'
+    return renderTemplate('mergeProcDelta', dict(sourceContext, **{
+        'tableName' : tableName,
+        'targetScope' : targetScope,
+        'mergeTarget' : 'scopedTarget' if mergeMode == 'scoped' else schemaPrefix() + tableName,
+        'joinConditions' : (("\t\ton " if index == 0 else "\t\tand ") + "source." + joinCol + " = target." + joinCol + '\n'
+                            for index, joinCol in enumerate(table.joinColumnNames)),
+        # the join columns already match, so they are neither compared nor rewritten
+        'matchedClause' : matchedClauseFragments([col for col in tableCols if col.name not in table.skipUpdateColumnNames
+                                                  and col.name not in table.joinColumnNames]),
+        'insertColumns' : delimited(("\t\t\t" + colName for colName in insertColNames), commaNewLineDelim),
+        'insertValues' : delimited(("\t\t\tsource." + colName for colName in insertColNames), commaNewLineDelim),
+        'deleteClause' : '\n\twhen not matched by source then delete' if mergeMode == 'scoped' else ''
+        }))
+
+def createMergeStatementOnTableType(sqlStatementFile, tableName, tableCols, tableConstraints, catalog):
+    with profileStage('merge emission'):
+        fragments = list(mergeStatementFragments(tableName, tableCols, tableConstraints, catalog))
+    writeFragments(sqlStatementFile, fragments)
+
+def dataSetterContext(tableName):
+    return { 'xmlComment' : getXMLComment(tableName, 'Set'), 'tableName' : tableName, 'tableParameterName' : camelCase(tableName) + 'Table',
+             'schemaPrefix' : schemaPrefix() }
+
+def dataSetterFragments(tableName):
+    if generationOptions['async']:
+        return renderTemplate('asyncDataSetter', dataSetterContext(tableName))
+    return renderTemplate('compactDataSetter' if generationOptions['compact'] else 'dataSetter', dataSetterContext(tableName))
+
+def stagingTableName(tableName):
+    return '#' + tableName + 'Staging'
+
+def bulkSetterFragments(tableName, tableCols, catalog):
+    # bulk copies into a session temp table shaped like the table type, then merges from it
+    # with Set<Table>FromStaging in the same transaction
+    keyColumnNames = catalogTable(catalog, tableName).keyColumnNames
+    return renderTemplate('asyncBulkSetter' if generationOptions['async'] else 'bulkSetter', dict(dataSetterContext(tableName), **{
+        'title' : re.sub(r"(\w)([A-Z])", r"\1 \2", tableName).lower(),
+        'stagingTable' : stagingTableName(tableName),
+        'stagingColumns' : commaDelim.join(createColumnDefinition(col, keyColumnNames) for col in tableCols),
+        'columnMappings' : ('\t\t\t\tbulkCopy.ColumnMappings.Add(' + quote(col.name) + commaDelim + quote(col.name) + ');\n' for col in tableCols),
+        'batchSize' : str(bulkCopyBatchSize),
+        'bulkThreshold' : str(bulkCopyThreshold)
+        }))
+
+def dataSetterControllerFragments(tableName):
+    return renderTemplate('asyncDataSetterController' if generationOptions['async'] else 'dataSetterController', dataSetterContext(tableName))
 
 # ACAS functionality only
-def createDataSettersForTableType(dataAccessMethodsFile, controllerAccessMethodsFile, tableName, tableCols, tableConstraints, connection):
-    print('Creating setters for: ' + tableName)
-    camelCaseTableName = camelCase(tableName)
-
-    dataAccessMethodsFile.write(getXMLComment(tableName, 'Set') +
-              'internal static void Set' + tableName + '(DataTable ' + camelCaseTableName + 'Table)' + ' \n{\n'
-              + '\tDataAccess.SetData(' + quote('Set' + tableName)
-              + ', new SqlParameter[] {\n'
-              + '\t\t new SqlParameter' + parenthesize(quote('@' + tableName + 'Table') + commaDelim + camelCaseTableName + 'Table')
-              + '\n\t}' + ')' + ';\n' + '}\n\n')
-    
-    controllerAccessMethodsFile.write(getXMLComment(tableName, 'Set')
-              + '[Route' + parenthesize(quote(tableName)) + ']\n'
-              + 'public PostResult Put' + tableName + '([FromBody] DataTable ' + camelCaseTableName + 'Table)\n'
-              + '{\n'
-              + '\tModels.Unknown.Set' + tableName + parenthesize(camelCaseTableName + 'Table') + '\n'
-              + '\treturn new PostResult(PostResult.ResultType.Success);\n'
-              + '}\n\n')
+def createDataSettersForTableType(dataAccessMethodsFile, controllerAccessMethodsFile, tableName, tableCols, tableConstraints, catalog):
+    with profileStage('setter emission'):
+        setterFragments = list(dataSetterFragments(tableName))
+        if generationOptions['bulkSetters'] and len(tableConstraints) != 0:
+            setterFragments += bulkSetterFragments(tableName, tableCols, catalog)
+    writeFragments(dataAccessMethodsFile, setterFragments)
+    with profileStage('controller emission'):
+        controllerFragments = list(dataSetterControllerFragments(tableName))
+    writeFragments(controllerAccessMethodsFile, controllerFragments)
 
 def createDataSetterDropStatements(sqlStatementFile, tableName):
-    print('Creating drop statements for: ' + tableName)
     sqlStatementFile.write('\n\n-- Drops the table type and stored procedure for ' + tableName + '\n')
     sqlStatementFile.write('drop procedure Set' + tableName + ';\n')
     sqlStatementFile.write('drop type ' + tableName + ';\n\n')
 
 def createInsertStatementOnTable(sqlStatementFile, tableName, tableCols):
-    print('Creating insert statements for: ' + tableName)
     sqlStatementFile.write("\n\n-- Inserts into table " + tableName + "\n")
     insertString = 'insert into ' + tableName + ' (\n'
     columnString = ''
     for col in tableCols:
-        columnString += '\t\t' + col[0] + commaNewLineDelim
+        columnString += '\t\t' + col.name + commaNewLineDelim
     insertString += columnString.rstrip(commaNewLineDelim) + ')\nvalues (\n'
     columnString = ''
     for col in tableCols:
-        columnString += '\t\t' + col[0] + ': ' + col[1] + commaNewLineDelim
+        columnString += '\t\t' + col.name + ': ' + col.dataType + commaNewLineDelim
     insertString += columnString.rstrip(commaNewLineDelim) + '\n)\n\n';
     sqlStatementFile.write(insertString)
 
 def createUpdateStatementOnTable(sqlStatementFile, tableName, tableCols, tableConstraints):
-    print('Creating update statements for: ' + tableName)
     sqlStatementFile.write("\n\n-- Updates table " + tableName + "\n")
     updateString = 'update set ' + tableName + '\n'
     columnString = ''
     for col in tableCols:
-        columnString += '\t\t' + col[0] + ' = ' + col[0] + ': ' + col[1] + commaNewLineDelim
+        columnString += '\t\t' + col.name + ' = ' + col.name + ': ' + col.dataType + commaNewLineDelim
         
 
 def createDeleteStatementOnTable(sqlStatementFile, tableName, tableCols):
-    print('Creating delete statements for: ' + tableName)
     pass
 
-def generateCLRDataSettersFromTableDefinitions(controllerAccessMethodsFile, dataAccessMethodsFile, sqlStatementFile, connection):
-    print('Generating setters.')
+def writeSettersHeader(controllerAccessMethodsFile, dataAccessMethodsFile, sqlStatementFile):
     dataAccessMethodsFile.write('\n')
+    if generationOptions['compact'] and not generationOptions['async']:
+        dataAccessMethodsFile.writelines(renderTemplate('sharedDataSetter', {}))
     controllerAccessMethodsFile.write('\n')
     sqlStatementFile.write('\n')
-    for tableName in tableNames:
-        tableCols = getTableColumns(connection, tableName)
-        primaryKeys = getTableConstraints(connection, tableName, 'primary key')
-        foreignKeys = getTableConstraints(connection, tableName, 'foreign key')
-        createTableType(sqlStatementFile, tableName, tableCols, primaryKeys, connection)
-        # createInsertStatementOnTable(sqlStatementFile, tableName, tableCols)
-        createMergeStatementOnTableType(sqlStatementFile, tableName, tableCols, primaryKeys, connection)
-        # createDataSetterDropStatements(sqlStatementFile, tableName)
-        createDataSettersForTableType(dataAccessMethodsFile, controllerAccessMethodsFile, tableName, tableCols, primaryKeys, connection)
+
+# markers in the SQL output that --deploy splits the script on
+deploymentWaveMarker = '-- deployment wave '
+deploymentUnitMarker = '-- deployment unit: '
+
+def writeWaveMarker(sqlStatementFile, waveIndex, waves):
+    waveTables, isCycle = waves[waveIndex]
+    sqlStatementFile.write('\n' + deploymentWaveMarker + str(waveIndex + 1) + ' of ' + str(len(waves)) + ': ' + str(len(waveTables)) + (' table' if len(waveTables) == 1 else ' tables')
+                           + (', foreign key cycle' if isCycle else '') + '\n')
+
+def writeFragments(openFile, fragments):
+    # a plan entry rendered into in-memory buffers isn't an output write, those are timed
+    # where the buffers are written out
+    if isinstance(openFile, io.StringIO):
+        openFile.writelines(fragments)
+        return
+    with profileStage('file writes'):
+        openFile.writelines(fragments)
+
+def createDataSettersForTable(controllerAccessMethodsFile, dataAccessMethodsFile, sqlStatementFile, tableName, catalog):
+    start = time.time()
+    tableCols = catalogTableColumns(catalog, tableName)
+    primaryKeys = catalogTableConstraints(catalog, tableName, 'primary key')
+    foreignKeys = catalogTableConstraints(catalog, tableName, 'foreign key')
+    sqlStatementFile.write('\n' + deploymentUnitMarker + tableName + '\n')
+    createTableType(sqlStatementFile, tableName, tableCols, primaryKeys, catalog)
+    # createInsertStatementOnTable(sqlStatementFile, tableName, tableCols)
+    createMergeStatementOnTableType(sqlStatementFile, tableName, tableCols, primaryKeys, catalog)
+    if generationOptions['bulkSetters'] and len(primaryKeys) != 0:
+        with profileStage('merge emission'):
+            fragments = list(mergeStatementFragments(tableName, tableCols, primaryKeys, catalog, staging=True))
+        writeFragments(sqlStatementFile, fragments)
+    # createDataSetterDropStatements(sqlStatementFile, tableName)
+    createDataSettersForTableType(dataAccessMethodsFile, controllerAccessMethodsFile, tableName, tableCols, primaryKeys, catalog)
+    runProfile['objectSeconds']['tables'][tableName] = time.time() - start
+
+def generateCLRDataSettersFromTableDefinitions(controllerAccessMethodsFile, dataAccessMethodsFile, sqlStatementFile, catalog):
+    # tables are written wave by wave, so every table comes after the tables its foreign keys reference
+    writeSettersHeader(controllerAccessMethodsFile, dataAccessMethodsFile, sqlStatementFile)
+    waves = catalogDeploymentWaves(catalog)
+    tableCount = 0
+    for waveIndex, (waveTables, isCycle) in enumerate(waves):
+        writeWaveMarker(sqlStatementFile, waveIndex, waves)
+        for tableName in waveTables:
+            createDataSettersForTable(controllerAccessMethodsFile, dataAccessMethodsFile, sqlStatementFile, tableName, catalog)
+            tableCount += 1
+            reportProgress('Data setters', tableCount, len(tableNames))
 
 def insertParamNewLines(paramsString, count = 2, tabs = 4):
-    newLinedParamString = ''
-    if len(paramsString.split(commaDelim)) > 3:
-        paramArray = paramsString.split(commaDelim)
-        counter = 0
-        for param in paramArray:
-            newLinedParamString += ('\t' * tabs) + param + commaDelim
-            counter += 1
-            if counter % count == 0:
-                newLinedParamString += '\n'
-    return newLinedParamString.rstrip(commaDelim)
+    # yields the parameters tab-indented, breaking the line after every count parameters
+    paramArray = paramsString.split(commaDelim)
+    if len(paramArray) <= 3:
+        return
+    for counter, param in enumerate(paramArray, 1):
+        yield ('\t' * tabs) + param
+        if counter < len(paramArray) or counter % count == 0:
+            yield commaDelim
+        if counter % count == 0:
+            yield '\n'
         
 def getProcParameters(procName, connection):
     cur = connection.cursor()
-    queryString = "select PARAMETER_NAME, DATA_TYPE \n" \
+    queryString = "select PARAMETER_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, coalesce(NUMERIC_SCALE, DATETIME_PRECISION), \n" \
+                + "USER_DEFINED_TYPE_SCHEMA + '.' + USER_DEFINED_TYPE_NAME \n" \
                 + "from INFORMATION_SCHEMA.PARAMETERS \n" \
-                + "where SPECIFIC_SCHEMA = 'dbo' \n" \
+                + "where SPECIFIC_SCHEMA = %s \n" \
                 + "and PARAMETER_MODE = 'IN' \n" \
-                + "and SPECIFIC_NAME = '" + procName + "'\n"
-    cur.execute(queryString)
+                + "and SPECIFIC_NAME = %s\n" \
+                + "order by ORDINAL_POSITION \n"
+    cur.execute(queryString, (generationOptions['schema'], procName))
     return cur
 
 def generateCLRUntypedParameterList(clrParameterNames):
-    untypedParamsString = ''
-    for clrParameterName in clrParameterNames:
-        if not clrParameterName in skipFields:
-            untypedParamsString += ('TransactionID' if clrParameterName == 'transactionID' else clrParameterName + commaDelim)
-    return untypedParamsString.rstrip(commaDelim)
+    untypedParams = [('TransactionID' if clrParameterName == 'transactionID' else clrParameterName + commaDelim)
+                     for clrParameterName in clrParameterNames if not clrParameterName in skipFields]
+    return ''.join(untypedParams).rstrip(commaDelim)
 
 def generateCLRTypedParameterList(clrParameterNames, clrParameterTypes):
-    clrParamsString = ''
-    for clrParameterName, clrParameterType in zip(clrParameterNames, clrParameterTypes):
-        if not clrParameterName in skipFields:
-            clrParamsString += clrParameterType + ' ' + clrParameterName + commaDelim
-    return clrParamsString.rstrip(commaDelim)
+    return commaDelim.join(clrParameterType + ' ' + clrParameterName for clrParameterName, clrParameterType in zip(clrParameterNames, clrParameterTypes)
+                           if not clrParameterName in skipFields)
             
 def generateCLRTypedDefaultParameterAssignments(clrParameterNames, clrParameterTypes, clrParameterDefaults):
     defaultValueParamsString = ''
@@ -416,12 +1697,27 @@ def generateCLRTypedDefaultParameterAssignments(clrParameterNames, clrParameterT
             defaultValueParamsString += '\t' + clrParameterType + ' ' + clrParameterName + ' = ' + clrParameterDefault + ';\n'
     return defaultValueParamsString
 
-def generateCLRSqlParameterObjectList(sqlParameterNames, clrParameterNames):
-    clrParamsString = ''
-    for sqlParameter, clrParameter in zip(sqlParameterNames, clrParameterNames):
-        replacementCLRParameter = (replacementFields[clrParameter] if clrParameter in list(replacementFields.keys()) else clrParameter)
-        clrParamsString += '\t\t' + 'new SqlParameter' + parenthesize(quote(sqlParameter) + commaDelim + clrParameter) + commaNewLineDelim
-    return clrParamsString.rstrip(commaDelim)
+def createSqlParameterObject(parameter, clrParameter, parameterName = None):
+    # declared type and size rather than ones inferred from each value, so that every call
+    # sends the same parameter signature and reuses one cached plan on the server;
+    # shared helpers pass the parameter name in a variable
+    size = (commaDelim + str(parameter.maximumLength)) if parameter.maximumLength is not None else ''
+    properties = []
+    if parameter.typeName is not None:
+        properties.append('TypeName = ' + quote(parameter.typeName))
+    if parameter.dataType in precisionTypes and parameter.precision is not None:
+        properties.append('Precision = ' + str(parameter.precision))
+        properties.append('Scale = ' + str(parameter.scale))
+    elif parameter.dataType in scaledTimeTypes and parameter.scale is not None:
+        properties.append('Scale = ' + str(parameter.scale))
+    properties.append('Value = ' + clrParameter)
+    return 'new SqlParameter' + parenthesize((parameterName if parameterName is not None else quote(parameter.name)) + commaDelim + 'SqlDbType.' + typeConverter[parameter.dataType]['sqlDbType'] + size) \
+           + ' ' + bracket(' ' + commaDelim.join(properties) + ' ')
+
+def generateCLRSqlParameterObjectList(parameters, clrParameterNames, parameterNames = None):
+    for index, (parameter, clrParameter) in enumerate(zip(parameters, clrParameterNames)):
+        replacementCLRParameter = replacementFields.get(clrParameter, clrParameter)
+        yield '\t\t' + createSqlParameterObject(parameter, clrParameter, parameterNames[index] if parameterNames is not None else None) + commaNewLineDelim
 
 def addConverter(clrParameterType, nullable = True):
     return '.ToObject<' + clrParameterType + ('?' if nullable == True and clrParameterType.lower() != "string" else '') + '>()'
@@ -429,108 +1725,1183 @@ def addConverter(clrParameterType, nullable = True):
 def createCLRTypeDefinition(clrParameterName, clrParameterType, nullable = True):
     return clrParameterType + ('?' if nullable == True and clrParameterType.lower() != "string" else '') + ' ' + clrParameterName
 
-def generateJObjectGetterParameterList(procName, clrParameterNames, clrParameterTypes):
-    paramsString = ''
-    for clrParameterName, clrParameterType in zip(clrParameterNames, clrParameterTypes):
-        paramsString += '\t\t' + procJObjectName(procName) + squareBracket(quote(clrParameterName)) + addConverter(clrParameterType) + commaNewLineDelim
-    return paramsString.rstrip(commaNewLineDelim)
+def generateJObjectGetterParameterList(procName, clrParameterNames, clrParameterTypes, extraArguments = ()):
+    return delimited(itertools.chain(('\t\t' + procJObjectName(procName) + squareBracket(quote(clrParameterName)) + addConverter(clrParameterType)
+                                      for clrParameterName, clrParameterType in zip(clrParameterNames, clrParameterTypes)),
+                                     ('\t\t' + extraArgument for extraArgument in extraArguments)), commaNewLineDelim)
 
 def generateJObjectGetterDefaultsList(procName, clrParameterNames, clrParameterTypes):
-    paramsString = ''
-    for clrParameterName, clrParameterType in zip(clrParameterNames, clrParameterTypes):
-        paramsString += '\t' + createCLRTypeDefinition(clrParameterName, clrParameterType) + ' = ' + procJObjectName(procName) + squareBracket(quote(clrParameterName)) + addConverter(clrParameterType) + semiColonNewLineDelim
+    paramsString = ''.join('\t' + createCLRTypeDefinition(clrParameterName, clrParameterType) + ' = ' + procJObjectName(procName) + squareBracket(quote(clrParameterName)) + addConverter(clrParameterType) + semiColonNewLineDelim
+                           for clrParameterName, clrParameterType in zip(clrParameterNames, clrParameterTypes))
     return paramsString.rstrip(commaNewLineDelim)
 
 def generateCLRWebAPIRoute(clrParameterNames):
-    routeParamsString = '/'
-    for clrParameter in clrParameterNames:
-        if not clrParameter in skipFields:
-            routeParamsString += bracket(clrParameter + (':id' if clrParameter[-2:] == 'ID' else '')) + '/'
-    return routeParamsString.rstrip(slashDelim)
+    routeParams = [bracket(clrParameter + (':id' if clrParameter[-2:] == 'ID' else '')) for clrParameter in clrParameterNames if not clrParameter in skipFields]
+    return (slashDelim + slashDelim.join(routeParams)).rstrip(slashDelim)
 
-# ACAS functionality only
-def generateCLRDataAccessorsFromStoredProcedure(controllerAccessMethodsFile, dataAccessMethodsFile, connection):
-    print('Creating data accessors for all tables')
+def writeAccessorsHeader(controllerAccessMethodsFile, dataAccessMethodsFile):
     dataAccessMethodsFile.write('\n')
+    if generationOptions['async']:
+        dataAccessMethodsFile.writelines(renderTemplate('asyncHelpers', {}))
+    elif generationOptions['typedReaders']:
+        dataAccessMethodsFile.writelines(renderTemplate('readRows', {}))
     controllerAccessMethodsFile.write('\n')
 
+def sqlParameterArrayFragments(parameters, clrParameterNames, parameterNames = None):
+    if len(parameters) != 0:
+        yield commaDelim + 'new SqlParameter[] {\n'
+        yield from generateCLRSqlParameterObjectList(parameters, clrParameterNames, parameterNames)
+        yield '\n\t}'
+
+def resultColumnReadExpression(column, clrType, ordinalName):
+    readExpression = 'reader.' + typeConverter.get(column.dataType, untypedResultColumn)['reader'] + '(' + ordinalName + ')'
+    if not column.isNullable:
+        return readExpression
+    nullValue = 'null' if clrType in clrReferenceTypes else '(' + clrType + '?)null'
+    return 'reader.IsDBNull(' + ordinalName + ') ? ' + nullValue + ' : ' + readExpression
+
+def resultRowContext(procName, resultColumns):
+    # POCO and ordinal-caching reader for a procedure's first result set; unnamed
+    # columns can't be mapped and a repeated name only maps its first column
+    rowClassName = genericProcName(procName) + 'Row'
+    columns = []
+    columnNames = set()
+    for column in resultColumns:
+        if column.name and column.name not in columnNames:
+            columnNames.add(column.name)
+            columns.append(column)
+    clrTypes = [typeConverter.get(column.dataType, untypedResultColumn)['type'] for column in columns]
+    ordinalNames = [camelCase(column.name) + 'Ordinal' for column in columns]
+    return {
+        'rowClassName' : rowClassName,
+        'rowReaderName' : rowClassName + 'Reader',
+        'properties' : ('\tpublic ' + clrType + ('?' if column.isNullable and clrType not in clrReferenceTypes else '') + ' ' + column.name + ' { get; set; }\n'
+                        for column, clrType in zip(columns, clrTypes)),
+        'ordinalFields' : ('\tprivate readonly int ' + ordinalName + ';\n' for ordinalName in ordinalNames),
+        'ordinalLookups' : ('\t\t' + ordinalName + ' = reader.GetOrdinal(' + quote(column.name) + ');\n' for column, ordinalName in zip(columns, ordinalNames)),
+        'assignments' : delimited(('\t\t\t' + column.name + ' = ' + resultColumnReadExpression(column, clrType, ordinalName)
+                                   for column, clrType, ordinalName in zip(columns, clrTypes, ordinalNames)), commaNewLineDelim)
+        }
+
+def accessorContext(procName, catalog):
+    parameters = catalogProcParameters(catalog, procName)
+    
+    sqlParameterNames = [parameter.name for parameter in parameters]
+    sqlParameterTypes = [parameter.dataType for parameter in parameters]
+    clrParameterNames = [sqlParamToParamName(parameter.name) for parameter in parameters]
+    clrParameterTypes = [typeConverter[parameter.dataType]["type"] for parameter in parameters]
+    clrParameterDefaults = [typeConverter[parameter.dataType]["default"] for parameter in parameters]
+    
+    action = procName[:3].lower()
+    isPlural = sqlProcedureNameIsPlural(procName, procPluralExceptions)
+
+    actionTemplate = ''
+    if action == 'get':
+        actionTemplate = 'DataTable' if isPlural else 'JObject'
+    elif action == 'set':
+        actionTemplate = 'void'
+
+    conversionTemplateBegin = ''
+    conversionTemplateEnd = ''
+    if action == 'get':
+        conversionTemplateBegin = ('Utility.DataTableRowToObject(' if not isPlural else '')
+        conversionTemplateEnd = (')' if not isPlural else '')
+
+    actionMethodName = ''
+    if action == 'get':
+        actionMethodName = 'GetDataTable'
+    elif action == 'set':
+        actionMethodName = 'SetData'
+
+    namespaceTemplate = ''
+    if action == 'get':
+        namespaceTemplate = 'Models.' + ('Transaction' if 'transaction' in procName.lower() else 'ReferentialData') + '.'
+    else:
+        namespaceTemplate = 'Models.Unknown.'
+
+    context = {
+        'action' : action,
+        'typedReader' : False,
+        'xmlComment' : getXMLComment(procName, action),
+        'procName' : procName,
+        'schemaPrefix' : schemaPrefix(),
+        'methodName' : sqlSetToPutMethodName(procName),
+        'returnType' : actionTemplate,
+        'returnStatement' : ('return ' if action == 'get' else ''),
+        'parameters' : generateCLRTypedParameterList(clrParameterNames, clrParameterTypes),
+        'arguments' : generateCLRUntypedParameterList(clrParameterNames),
+        'route' : parseRouteName(procName) + generateCLRWebAPIRoute(clrParameterNames),
+        'namespace' : namespaceTemplate,
+        'conversionBegin' : conversionTemplateBegin,
+        'conversionEnd' : conversionTemplateEnd,
+        'dataAccessMethod' : actionMethodName,
+        'sqlParameters' : sqlParameterArrayFragments(parameters, clrParameterNames),
+        'jObjectName' : procJObjectName(procName),
+        'jObjectArguments' : generateJObjectGetterParameterList(procName, clrParameterNames, clrParameterTypes)
+        }
+
+    # typed readers stream rows straight into objects instead of going through a DataTable,
+    # plural procedures return the rows lazily
+    resultColumns = catalog['procs'][procName].resultColumns
+    if action == 'get' and generationOptions['typedReaders'] and len(resultColumns) != 0:
+        context.update(resultRowContext(procName, resultColumns))
+        context['typedReader'] = True
+        context['returnType'] = ('IEnumerable<' + context['rowClassName'] + '>') if isPlural else context['rowClassName']
+        context['rowSelection'] = '' if isPlural else '.FirstOrDefault()'
+        context['conversionBegin'] = ''
+        context['conversionEnd'] = ''
+    if generationOptions['async']:
+        context.update(asyncAccessorContext(context, procName, isPlural, parameters, clrParameterNames, clrParameterTypes, len(resultColumns)))
+    # compact output: accessors sharing a signature become one line calls to the group's helper
+    if generationOptions['compact'] and procName in catalogAccessorHelpers(catalog):
+        context['helperName'] = catalogAccessorHelpers(catalog)[procName]
+        context['helperArguments'] = ''.join(commaDelim + quote(parameter.name) + commaDelim + clrParameterName
+                                             for parameter, clrParameterName in zip(parameters, clrParameterNames))
+    return context
+
+def asyncAccessorContext(context, procName, isPlural, parameters, clrParameterNames, clrParameterTypes, resultColumnCount):
+    # Task returning accessors and async controllers taking a CancellationToken, plural
+    # Get procedures also get an IAsyncEnumerable variant that streams rows as they are read
+    action = context['action']
+    typedRowReader = ('reader => new ' + context['rowReaderName'] + '(reader).Read') if context['typedReader'] else None
+    asyncResultType = None
+    asyncDataAccessMethod = 'SetDataAsync'
+    if action == 'get' and context['typedReader']:
+        asyncResultType = ('List<' + context['rowClassName'] + '>') if isPlural else context['rowClassName']
+        asyncDataAccessMethod = ('ReadListAsync<' if isPlural else 'ReadRowAsync<') + context['rowClassName'] + '>'
+    elif action == 'get':
+        asyncResultType = context['returnType']
+        asyncDataAccessMethod = 'GetDataTableAsync'
+
+    typedParameters = generateCLRTypedParameterList(clrParameterNames, clrParameterTypes)
+    untypedArguments = generateCLRUntypedParameterList(clrParameterNames)
+    commandBehavior = ''
+    if action == 'get':
+        commandBehavior = 'CommandBehavior.' + ('SequentialAccess' if resultColumnCount >= wideRowColumnCount else 'Default') + commaDelim
+    asyncContext = {
+        'asyncModifier' : 'async ' if context['conversionBegin'] else '',
+        'awaitKeyword' : 'await ' if context['conversionBegin'] else '',
+        'asyncReturnType' : ('Task<' + asyncResultType + '>') if asyncResultType is not None else 'Task',
+        'asyncParameters' : typedParameters + (commaDelim if typedParameters else '') + 'CancellationToken cancellationToken = default(CancellationToken)',
+        'asyncControllerParameters' : typedParameters + (commaDelim if typedParameters else '') + 'CancellationToken cancellationToken',
+        'asyncArguments' : untypedArguments + (commaDelim if untypedArguments else '') + 'cancellationToken',
+        'asyncDataAccessMethod' : asyncDataAccessMethod,
+        'rowReaderArgument' : (commaDelim + typedRowReader) if typedRowReader is not None else '',
+        'commandBehavior' : commandBehavior,
+        'asyncJObjectArguments' : generateJObjectGetterParameterList(procName, clrParameterNames, clrParameterTypes, ['cancellationToken']),
+        'isStreamed' : action == 'get' and isPlural
+        }
+    if asyncContext['isStreamed']:
+        asyncContext['streamRowType'] = context['rowClassName'] if context['typedReader'] else 'JObject'
+        asyncContext['streamRowReader'] = typedRowReader if typedRowReader is not None else 'reader => RowToJObject'
+        asyncContext['streamSqlParameters'] = sqlParameterArrayFragments(parameters, clrParameterNames)
+    return asyncContext
+
+def accessorFragments(context):
+    if context['typedReader']:
+        yield from renderTemplate('resultRow', context)
+    if generationOptions['async']:
+        yield from renderTemplate('asyncAccessor', context)
+        if context['isStreamed']:
+            yield from renderTemplate('asyncStreamAccessor', context)
+    elif context['typedReader']:
+        yield from renderTemplate('readerAccessor', context)
+    elif 'helperName' in context:
+        yield from renderTemplate('compactAccessor', context)
+    else:
+        yield from renderTemplate('accessor', context)
+
+def accessorIsCompactable(procName, catalog):
+    # plain DataTable accessors only, the async and typed reader ones already call shared helpers
+    if generationOptions['async']:
+        return False
+    return not (generationOptions['typedReaders'] and procName[:3].lower() == 'get' and len(catalog['procs'][procName].resultColumns) != 0)
+
+def accessorSignature(procName, catalog):
+    # what an accessor's body depends on besides the procedure and parameter names
+    action = procName[:3].lower()
+    isPlural = sqlProcedureNameIsPlural(procName, procPluralExceptions) if action == 'get' else None
+    return (action, isPlural, tuple(tuple(parameter.toRow()[1:]) for parameter in catalogProcParameters(catalog, procName)))
+
+def buildAccessorGroups(catalog):
+    # (helper name, procedures) for every signature shared by two or more procedures, in procNames order;
+    # helpers are named after their signature so they keep their name as procedures come and go
+    groups = {}
     for procName in procNames:
-        
-        cur = getProcParameters(procName, connection)
-        rows = []
-        for row in cur:
-            rows.append((row[0], row[1]))
-        
-        sqlParameterNames = list(map((lambda row : row[0]), rows))
-        sqlParameterTypes = list(map((lambda row : row[1]), rows))
-        clrParameterNames = list(map((lambda row : sqlParamToParamName(row[0])), rows))
-        clrParameterTypes = list(map((lambda row : typeConverter[row[1]]["type"]), rows))
-        clrParameterDefaults = list(map((lambda row : typeConverter[row[1]]["default"]), rows))
-        
-        paramsString = generateCLRTypedParameterList(clrParameterNames, clrParameterTypes)
-        untypedParamsString = generateCLRUntypedParameterList(clrParameterNames)
-        sqlParamsString = generateCLRSqlParameterObjectList(sqlParameterNames, clrParameterNames)
-        routeParamsString = generateCLRWebAPIRoute(clrParameterNames)
-        jObjectParameterString = generateJObjectGetterParameterList(procName, clrParameterNames, clrParameterTypes)
-        jObjectDefaultsList = generateJObjectGetterDefaultsList(procName, clrParameterNames, clrParameterTypes)
-        
-        action = procName[:3].lower()
-
-        actionTemplate = ''
-        if action == 'get':
-            actionTemplate = 'DataTable' if sqlProcedureNameIsPlural(procName, procPluralExceptions) else 'JObject'
-        elif action == 'set':
-            actionTemplate = 'void'
-
-        conversionTemplateBegin = ''
-        conversionTemplateEnd = ''
-        if action == 'get':
-            conversionTemplateBegin = ('Utility.DataTableRowToObject(' if not sqlProcedureNameIsPlural(procName, procPluralExceptions) else '')
-            conversionTemplateEnd = (')' if not sqlProcedureNameIsPlural(procName, procPluralExceptions) else '')
-
-        actionMethodName = ''
-        if action == 'get':
-            actionMethodName = 'GetDataTable'
-        elif action == 'set':
-            actionMethodName = 'SetData'
-
-        namespaceTemplate = ''
-        if action == 'get':
-            namespaceTemplate = 'Models.' + ('Transaction' if 'transaction' in procName.lower() else 'ReferentialData') + '.'
+        if accessorIsCompactable(procName, catalog):
+            groups.setdefault(accessorSignature(procName, catalog), []).append(procName)
+    return [('Shared' + capitalize(signature[0]) + hashlib.sha1(repr(signature).encode('utf-8')).hexdigest()[:8], groupProcNames)
+            for signature, groupProcNames in groups.items() if len(groupProcNames) > 1]
+
+def catalogAccessorGroups(catalog):
+    return catalogDerived(catalog, 'accessorGroups', buildAccessorGroups)
+
+def catalogAccessorHelpers(catalog):
+    # procedure name -> the shared helper its accessor calls
+    return catalogDerived(catalog, 'accessorHelpers', lambda catalog : dict((procName, helperName) for helperName, groupProcNames in catalogAccessorGroups(catalog)
+                                                                            for procName in groupProcNames))
+
+def sharedAccessorFragments(helperName, groupProcNames, catalog):
+    # the body each accessor of the group would repeat, taking the procedure and parameter names
+    parameters = catalogProcParameters(catalog, groupProcNames[0])
+    valueNames = ['value' + str(index) for index in range(len(parameters))]
+    parameterNames = ['parameterName' + str(index) for index in range(len(parameters))]
+    return renderTemplate('sharedAccessor', dict(accessorContext(groupProcNames[0], catalog), **{
+        'helperName' : helperName,
+        'procCount' : str(len(groupProcNames)),
+        'helperParameters' : ''.join(commaDelim + 'string ' + parameterName + commaDelim + typeConverter[parameter.dataType]['type'] + ' ' + valueName
+                                     for parameter, parameterName, valueName in zip(parameters, parameterNames, valueNames)),
+        'sqlParameters' : sqlParameterArrayFragments(parameters, valueNames, parameterNames)
+        }))
+
+def writeSharedAccessors(dataAccessMethodsFile, catalog):
+    with profileStage('accessor emission'):
+        fragments = [fragment for helperName, groupProcNames in catalogAccessorGroups(catalog)
+                     for fragment in sharedAccessorFragments(helperName, groupProcNames, catalog)]
+    writeFragments(dataAccessMethodsFile, fragments)
+
+def accessorControllerFragments(context):
+    if generationOptions['async']:
+        return renderTemplate('asyncGetController' if context['action'] == 'get' else 'asyncSetController', context)
+    return renderTemplate('getController' if context['action'] == 'get' else 'setController', context)
+
+# ACAS functionality only
+def createDataAccessorsForProc(controllerAccessMethodsFile, dataAccessMethodsFile, procName, catalog):
+    start = time.time()
+    with profileStage('accessor emission'):
+        context = accessorContext(procName, catalog)
+        accessorText = list(accessorFragments(context))
+    writeFragments(dataAccessMethodsFile, accessorText)
+    with profileStage('controller emission'):
+        controllerText = list(accessorControllerFragments(context))
+    writeFragments(controllerAccessMethodsFile, controllerText)
+    runProfile['objectSeconds']['procs'][procName] = time.time() - start
+
+# ACAS functionality only
+def generateCLRDataAccessorsFromStoredProcedure(controllerAccessMethodsFile, dataAccessMethodsFile, catalog):
+    writeAccessorsHeader(controllerAccessMethodsFile, dataAccessMethodsFile)
+    if generationOptions['compact']:
+        writeSharedAccessors(dataAccessMethodsFile, catalog)
+    for index, procName in enumerate(procNames):
+        createDataAccessorsForProc(controllerAccessMethodsFile, dataAccessMethodsFile, procName, catalog)
+        reportProgress('Data accessors', index + 1, len(procNames))
+
+# generated outputs, written next to the repository by default
+outputDirectory = '../../'
+outputFileNames = [('controller', 'ControllerMethodsFile.cs'),
+                   ('dataAccess', 'DataAccessMethodsFile.cs'),
+                   ('sql', 'SQLStatementFile.sql')]
+manifestFileName = 'GenerationManifest.json'
+watchStatusFileName = 'WatchStatus.json'
+# --split-classes writes the C# as one partial class file per table or procedure entity instead
+splitDirectories = { 'controller' : 'Controllers', 'dataAccess' : 'DataAccess' }
+splitFileExtension = '.generated.cs'
+splitSharedEntity = 'Shared'
+splitRecordFileName = 'SplitClassFiles.json'
+partialClassDeclarations = { 'controller' : 'public partial class GeneratedController',
+                             'dataAccess' : 'internal static partial class DataAccessMethods' }
+splitFileUsings = ['System', 'System.Collections.Generic', 'System.Data', 'System.Data.SqlClient', 'System.Linq',
+                   'System.Runtime.CompilerServices', 'System.Threading', 'System.Threading.Tasks', 'Newtonsoft.Json.Linq']
+outputBufferSize = 1 << 20
+# matches what open(path, 'w') would write, so incremental and full runs produce the same bytes
+outputEncoding = locale.getpreferredencoding(False)
+
+def getGeneratorVersion():
+    # any change to this script (settings included) or to the templates invalidates every generated fragment
+    with open(os.path.abspath(__file__), 'rb') as scriptFile:
+        versionHash = hashlib.sha1(scriptFile.read())
+    versionHash.update(json.dumps([templateTexts, generationOptions], sort_keys=True).encode('utf-8'))
+    return versionHash.hexdigest()
+
+def buildGenerationPlan(catalog):
+    # objects in output order, mirroring generateCLRDataAccessorsFromStoredProcedure
+    # followed by generateCLRDataSettersFromTableDefinitions
+    plan = [('header', 'accessors')]
+    if generationOptions['compact']:
+        # worked out here, like the waves, so the catalog handed to pool workers already carries the groups
+        catalogAccessorHelpers(catalog)
+        plan += [('shared', 'accessors')]
+    plan += [('procs', procName) for procName in procNames]
+    plan += [('header', 'setters')]
+    for waveIndex, (waveTables, isCycle) in enumerate(catalogDeploymentWaves(catalog)):
+        plan += [('wave', str(waveIndex + 1))]
+        plan += [('tables', tableName) for tableName in waveTables]
+    return plan
+
+def payloadHash(payload):
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def catalogObjectHash(catalog, objectType, objectName):
+    # the hash of a table's or procedure's metadata; the metadata cache keeps it with each entry, so only
+    # objects that weren't read from the cache are serialized, once per catalog
+    objectHashes = catalog.setdefault('hashes', { 'tables' : {}, 'procs' : {} })[objectType]
+    if objectName not in objectHashes:
+        objectHashes[objectName] = payloadHash(json.dumps(catalogObjectToEntry(objectType, catalog[objectType][objectName])))
+    return objectHashes[objectName]
+
+def getSourceHash(catalog, objectType, objectName):
+    if objectType == 'wave':
+        waves = catalogDeploymentWaves(catalog)
+        entry = [len(waves), len(waves[int(objectName) - 1][0]), waves[int(objectName) - 1][1]]
+    elif objectType == 'shared':
+        entry = [[helperName, len(groupProcNames)] for helperName, groupProcNames in catalogAccessorGroups(catalog)]
+    elif objectType == 'header':
+        entry = None
+    else:
+        entry = [catalogObjectHash(catalog, objectType, objectName)]
+        if objectType == 'procs' and generationOptions['compact']:
+            entry.append(catalogAccessorHelpers(catalog).get(objectName))
+    return payloadHash(json.dumps([objectType, objectName, entry]))
+
+def renderObjectFragments(catalog, objectType, objectName):
+    buffers = dict((fileKey, io.StringIO()) for fileKey, fileName in outputFileNames)
+    if objectType == 'procs':
+        createDataAccessorsForProc(buffers['controller'], buffers['dataAccess'], objectName, catalog)
+    elif objectType == 'tables':
+        createDataSettersForTable(buffers['controller'], buffers['dataAccess'], buffers['sql'], objectName, catalog)
+    elif objectType == 'wave':
+        writeWaveMarker(buffers['sql'], int(objectName) - 1, catalogDeploymentWaves(catalog))
+    elif objectType == 'shared':
+        writeSharedAccessors(buffers['dataAccess'], catalog)
+    elif objectName == 'accessors':
+        writeAccessorsHeader(buffers['controller'], buffers['dataAccess'])
+    else:
+        writeSettersHeader(buffers['controller'], buffers['dataAccess'], buffers['sql'])
+    return dict((fileKey, buffer.getvalue().replace('\n', os.linesep).encode(outputEncoding)) for fileKey, buffer in buffers.items())
+
+# catalog handed to each process pool worker once, instead of with every object
+workerCatalog = None
+
+def initializeRenderWorker(catalog, texts, options, selectedTables, selectedProcs):
+    # spawned workers (the default on Windows and macOS) start from a fresh import, so everything
+    # the emitters read from module state is handed over, tableNames and procNames included
+    global workerCatalog
+    workerCatalog = catalog
+    setTemplates(texts)
+    generationOptions.update(options)
+    tableNames[:] = selectedTables
+    procNames[:] = selectedProcs
+
+def renderPlanEntry(planEntry):
+    # each object's timings go back with its fragments, the parent process owns the run profile
+    resetRunProfile()
+    fragments = renderObjectFragments(workerCatalog, planEntry[0], planEntry[1])
+    return fragments, runProfile['stages'], runProfile['objectSeconds']
+
+def renderPlan(catalog, plan, jobs = 1):
+    # yields the fragments of each plan entry in plan order; with more than one job the objects
+    # are rendered across a process pool and reassembled in the same order as the serial path
+    if jobs <= 1 or len(plan) <= 1:
+        for index, (objectType, objectName) in enumerate(plan):
+            fragments = renderObjectFragments(catalog, objectType, objectName)
+            reportProgress('Rendered objects', index + 1, len(plan))
+            yield fragments
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=initializeRenderWorker,
+                                                initargs=(catalog, templateTexts, generationOptions, tableNames, procNames)) as executor:
+        for index, (fragments, stages, objectSeconds) in enumerate(executor.map(renderPlanEntry, plan, chunksize=max(1, len(plan) // (jobs * 8)))):
+            mergeRunProfile(stages, objectSeconds)
+            reportProgress('Rendered objects', index + 1, len(plan))
+            yield fragments
+
+def loadManifest(manifestPath, generatorVersion):
+    # a manifest is only usable if it was written by this exact generator and its outputs still have the size
+    # and modification time it recorded; a hand edited or checked out output is regenerated in full
+    try:
+        with open(manifestPath, 'r') as manifestFile:
+            manifest = json.load(manifestFile)
+    except (IOError, ValueError):
+        return None
+    if manifest.get('version') != generatorVersion or 'outputs' not in manifest:
+        return None
+    for fileKey, fileName in outputFileNames:
+        try:
+            outputStat = os.stat(os.path.join(os.path.dirname(manifestPath), fileName))
+        except OSError:
+            return None
+        if manifest['outputs'].get(fileKey) != [outputStat.st_size, outputStat.st_mtime_ns]:
+            return None
+    return manifest
+
+class SplicedOutput(object):
+    # an output brought up to date fragment by fragment, in plan order. Fragments matching the old file are
+    # only counted until one differs, from there the file is rewritten into a temp file, copying each run of
+    # unchanged fragments straight from the old file; a file where nothing differs is never opened
+    def __init__(self, path, oldLayout):
+        self.path = path
+        self.oldLayout = oldLayout
+        self.oldPositions = dict((key, (offset, length)) for key, offset, length in oldLayout) if oldLayout is not None else {}
+        self.matchedCount = 0
+        self.oldFile = None
+        self.newFile = None
+        self.pendingCopy = None
+        if oldLayout is None:
+            self.startRewrite()
+
+    def readOldFragment(self, key):
+        if self.oldFile is None:
+            self.oldFile = open(self.path, 'rb')
+        offset, length = self.oldPositions[key]
+        self.oldFile.seek(offset)
+        return self.oldFile.read(length)
+
+    def startRewrite(self):
+        self.newFile = open(self.path + '.tmp', 'wb', buffering=outputBufferSize)
+        if self.matchedCount != 0:
+            key, offset, length = self.oldLayout[self.matchedCount - 1]
+            self.pendingCopy = (0, offset + length)
+
+    def copyPending(self):
+        if self.pendingCopy is None:
+            return
+        if self.oldFile is None:
+            self.oldFile = open(self.path, 'rb')
+        start, end = self.pendingCopy
+        self.pendingCopy = None
+        self.oldFile.seek(start)
+        with profileStage('file writes'):
+            while start < end:
+                chunk = self.oldFile.read(min(outputBufferSize, end - start))
+                self.newFile.write(chunk)
+                start += len(chunk)
+
+    def add(self, key, fragment):
+        # fragment is None for an object that didn't change, whose fragment is kept from the old file
+        if self.newFile is None:
+            if (self.matchedCount < len(self.oldLayout) and self.oldLayout[self.matchedCount][0] == key
+                    and (fragment is None or fragment == self.readOldFragment(key))):
+                self.matchedCount += 1
+                return
+            self.startRewrite()
+        if fragment is not None:
+            self.copyPending()
+            with profileStage('file writes'):
+                self.newFile.write(fragment)
+            return
+        offset, length = self.oldPositions[key]
+        if self.pendingCopy is not None and self.pendingCopy[1] == offset:
+            self.pendingCopy = (self.pendingCopy[0], offset + length)
         else:
-            namespaceTemplate = 'Models.Unknown.'
+            self.copyPending()
+            self.pendingCopy = (offset, offset + length)
+
+    def finish(self):
+        # returns whether the file was rewritten
+        if self.newFile is None and self.matchedCount != len(self.oldLayout):
+            self.startRewrite()
+        if self.newFile is None:
+            self.close()
+            return False
+        self.copyPending()
+        self.close()
+        os.replace(self.path + '.tmp', self.path)
+        return True
 
-        paramsTemplate = (commaDelim + 'new SqlParameter[] {\n' if len(sqlParamsString) != 0 else '') + sqlParamsString + ('\n\t}' if len(sqlParamsString) != 0 else '')
-        
-        dataAccessMethodsFile.write(getXMLComment(procName, action) +
-              'internal static ' + actionTemplate + ' ' + sqlSetToPutMethodName(procName) + parenthesize(paramsString) + ' \n{\n'
-              + '\t' + ('return ' if action == 'get' else '') + conversionTemplateBegin + 'DataAccess.' + actionMethodName + '(' + quote(procName)
-              + paramsTemplate + ')' + conversionTemplateEnd + ';\n' + '}\n\n')
-
-        if action == 'get':
-            controllerAccessMethodsFile.write(getXMLComment(procName, action)
-                  + squareBracket('Route' + parenthesize(quote(parseRouteName(procName) + routeParamsString))) + '\n'
-                  + 'public ' + actionTemplate + ' ' + procName + parenthesize(paramsString) + '\n'
-                  + '{\n'
-                  + '\treturn ' + namespaceTemplate + procName + parenthesize(untypedParamsString) + ';\n'
-                  + '}\n\n')
+    def close(self):
+        for openFile in (self.oldFile, self.newFile):
+            if openFile is not None:
+                openFile.close()
+
+def manifestLayout(manifestObjects, fileIndex):
+    # (key, offset, length) of each object's fragment in one output, rebuilt from the objects' fragment lengths
+    layout = []
+    offset = 0
+    for key, objectRecord in manifestObjects.items():
+        if objectRecord[fileIndex + 1] != 0:
+            layout.append((key, offset, objectRecord[fileIndex + 1]))
+            offset += objectRecord[fileIndex + 1]
+    return layout
+
+def spliceSelectedKeys(oldKeys, selectedKeys, selection):
+    # the earlier run's objects with the selected ones put in: an object already there keeps its place, a new one goes
+    # after the last object of its type, and one the selection covers that wasn't discovered again was dropped
+    keys = [key for key in oldKeys if key in selectedKeys or key.split('/', 1)[0] not in ('tables', 'procs') or not selection(key.split('/', 1)[1])]
+    for key in selectedKeys:
+        if key in oldKeys:
+            continue
+        objectType = key.split('/', 1)[0]
+        lastIndex = max((index for index, existingKey in enumerate(keys) if existingKey.split('/', 1)[0] == objectType), default=len(keys) - 1)
+        keys.insert(lastIndex + 1, key)
+    return keys
+
+def generateIncrementally(catalog, directory, jobs = 1, selection = None):
+    # re-renders only the objects whose metadata hash changed and splices them into the existing outputs;
+    # the manifest records each object's hash and fragment lengths in file order, and each output's size and mtime.
+    # A selective run, where selection tells the object names it covers, only splices in the selected tables and
+    # procedures and keeps everything else, the headers and deployment waves included, from the earlier run
+    generatorVersion = getGeneratorVersion()
+    manifestPath = os.path.join(directory, manifestFileName)
+    manifest = loadManifest(manifestPath, generatorVersion)
+    if selection is not None and manifest is None:
+        raise RuntimeError('--include and --exclude splice the selected objects into the outputs of an earlier --incremental run, '
+                           + 'and ' + os.path.abspath(directory) + ' has none written with these options; run once without them first')
+    oldObjects = manifest['objects'] if manifest is not None else {}
+
+    plan = buildGenerationPlan(catalog)
+    if selection is not None:
+        plan = [(objectType, objectName) for objectType, objectName in plan if objectType in ('tables', 'procs')]
+    sourceHashes = dict((objectType + '/' + objectName, getSourceHash(catalog, objectType, objectName)) for objectType, objectName in plan)
+    planKeys = list(sourceHashes) if selection is None else spliceSelectedKeys(oldObjects, sourceHashes, selection)
+    planHashes = [sourceHashes[key] if key in sourceHashes else oldObjects[key][0] for key in planKeys]
+    changedPlan = [tuple(key.split('/', 1)) for key, sourceHash in zip(planKeys, planHashes) if oldObjects.get(key, [None])[0] != sourceHash]
+
+    # changed objects are rendered in plan order and spliced in as they come, so only one object's fragments are held at a time
+    outputs = [SplicedOutput(os.path.join(directory, fileName), manifestLayout(oldObjects, fileIndex) if manifest is not None else None)
+               for fileIndex, (fileKey, fileName) in enumerate(outputFileNames)]
+    newObjects = {}
+    rewrittenFiles = []
+    try:
+        renderedFragments = renderPlan(catalog, changedPlan, jobs)
+        for key, sourceHash in zip(planKeys, planHashes):
+            objectRecord = oldObjects.get(key)
+            if objectRecord is not None and objectRecord[0] == sourceHash:
+                for output, length in zip(outputs, objectRecord[1:]):
+                    if length != 0:
+                        output.add(key, None)
+            else:
+                fragments = next(renderedFragments)
+                objectRecord = [sourceHash]
+                for output, (fileKey, fileName) in zip(outputs, outputFileNames):
+                    objectRecord.append(len(fragments[fileKey]))
+                    if len(fragments[fileKey]) != 0:
+                        output.add(key, fragments[fileKey])
+            newObjects[key] = objectRecord
+        for output, (fileKey, fileName) in zip(outputs, outputFileNames):
+            if output.finish():
+                rewrittenFiles.append(fileName)
+    finally:
+        for output in outputs:
+            output.close()
+
+    newManifest = { 'version' : generatorVersion, 'objects' : newObjects, 'outputs' : {} }
+    for fileKey, fileName in outputFileNames:
+        outputStat = os.stat(os.path.join(directory, fileName))
+        newManifest['outputs'][fileKey] = [outputStat.st_size, outputStat.st_mtime_ns]
+        recordOutputBytes(fileName, outputStat.st_size if fileName in rewrittenFiles else 0)
+    with open(manifestPath, 'w') as manifestFile:
+        json.dump(newManifest, manifestFile)
+
+    print('Incremental generation: ' + str(len(changedPlan)) + ' of ' + str(len(plan)) + (' selected' if selection is not None else '') + ' objects regenerated, '
+          + (', '.join(rewrittenFiles) if len(rewrittenFiles) != 0 else 'no files') + ' rewritten')
+    return len(changedPlan)
+
+def benchmarkTemplates(objectCount):
+    # renders objectCount synthetic objects through each artifact template and reports the throughput
+    entries = { 'tables' : {}, 'procs' : {} }
+    table = createCatalogTable()
+    table['columns'] = [('BenchmarkID', 'int', 'NO', None, 10, 0)] + [('Column' + str(index), 'nvarchar', 'YES', 50, None, None) for index in range(19)]
+    table['primary key'] = [('BenchmarkTable', 'BenchmarkID', 'PRIMARY KEY', 'int', 'NO', None)]
+    table['identity'] = 'BenchmarkID'
+    entries['tables']['BenchmarkTable'] = table
+    for procName in ('GetBenchmarkRows', 'SetBenchmarkRow'):
+        proc = createCatalogProc()
+        proc['parameters'] = [('@benchmarkID', 'int', None, 10, 0, None), ('@name', 'nvarchar', 50, None, None, None), ('@amount', 'decimal', None, 18, 2, None),
+                              ('@isActive', 'bit', None, None, None, None), ('@createdDate', 'datetime', None, None, None, None)]
+        entries['procs'][procName] = proc
+    catalog = catalogFromEntries(entries)
+
+    tableCols = catalogTableColumns(catalog, 'BenchmarkTable')
+    primaryKeys = catalogTableConstraints(catalog, 'BenchmarkTable', 'primary key')
+    artifacts = [('table type', lambda : tableTypeFragments('BenchmarkTable', tableCols, primaryKeys, catalog)),
+                 ('merge procedure', lambda : mergeStatementFragments('BenchmarkTable', tableCols, primaryKeys, catalog)),
+                 ('data setter', lambda : dataSetterFragments('BenchmarkTable')),
+                 ('data setter controller', lambda : dataSetterControllerFragments('BenchmarkTable')),
+                 ('get accessor', lambda : accessorFragments(accessorContext('GetBenchmarkRows', catalog))),
+                 ('get controller', lambda : accessorControllerFragments(accessorContext('GetBenchmarkRows', catalog))),
+                 ('set accessor', lambda : accessorFragments(accessorContext('SetBenchmarkRow', catalog))),
+                 ('set controller', lambda : accessorControllerFragments(accessorContext('SetBenchmarkRow', catalog)))]
+    for artifactName, render in artifacts:
+        start = time.time()
+        for index in range(objectCount):
+            for fragment in render():
+                pass
+        elapsed = max(time.time() - start, 1e-9)
+        print(artifactName + ': ' + '%.0f' % (objectCount / elapsed) + ' objects/s')
+
+def parseDeploymentScript(scriptText):
+    # splits a generated SQL script into waves of units, each unit being the batches for one table in
+    # script order; anything before the first wave marker is applied first as a wave of its own
+    waves = [[]]
+    unitName = None
+    unitLines = []
+    for line in scriptText.splitlines():
+        if line.startswith(deploymentWaveMarker) or line.startswith(deploymentUnitMarker):
+            waves[-1].append((unitName, unitLines))
+            if line.startswith(deploymentWaveMarker):
+                waves.append([])
+            unitName = line[len(deploymentUnitMarker):].strip() if line.startswith(deploymentUnitMarker) else None
+            unitLines = []
         else:
-            controllerAccessMethodsFile.write(getXMLComment(procName, action) \
-                                              + squareBracket('Route' + parenthesize(quote(procName))) + '\n' \
-                                              + 'public ' + actionTemplate + ' ' + sqlSetToPutMethodName(procName) + parenthesize('[FromBody] JObject ' + procJObjectName(procName)) + '\n'
-                                              + '{\n'
-                                              + '\treturn ' + 'Models.Transaction.' + procName + parenthesize('\n' + jObjectParameterString) + '\n'
-                                              + '}\n\n')
-                                   
+            unitLines.append(line)
+    waves[-1].append((unitName, unitLines))
+
+    deploymentWaves = []
+    for wave in waves:
+        units = []
+        for unitName, unitLines in wave:
+            batches = [batch.strip() for batch in re.split(r'^\s*go\s*$', '\n'.join(unitLines), flags=re.MULTILINE | re.IGNORECASE)]
+            batches = [batch for batch in batches if len(batch) != 0]
+            if len(batches) != 0:
+                units.append((unitName, batches))
+        if len(units) != 0:
+            deploymentWaves.append(units)
+    return deploymentWaves
+
+def runDeploymentUnit(pool, batches):
+    # a unit's batches depend on each other (the merge procedure needs its table type), so they run in order on one connection
+    connection = pool.acquire()
+    try:
+        cursor = connection.cursor()
+        for batch in batches:
+            cursor.execute(batch)
+    finally:
+        pool.release(connection)
+
+def deployScript(scriptPath, arguments):
+    # applies the script wave by wave, running the units of a wave concurrently over a connection pool;
+    # a wave only starts once the previous one has been applied in full
+    with open(scriptPath, 'r') as scriptFile:
+        waves = parseDeploymentScript(scriptFile.read())
+    if pymssql is None:
+        raise ImportError('pymssql is required to deploy to ' + arguments.host)
+    pool = ConnectionPool(lambda : pymssql.connect(host=arguments.host, database=arguments.database, autocommit=True), arguments.deployConnections)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=arguments.deployConnections) as executor:
+            for waveIndex, units in enumerate(waves):
+                start = time.time()
+                futures = [(unitName, executor.submit(runDeploymentUnit, pool, batches)) for unitName, batches in units]
+                failures = []
+                for unitName, future in futures:
+                    try:
+                        future.result()
+                    except Exception as exception:
+                        failures.append(str(unitName) + ': ' + str(exception))
+                if len(failures) != 0:
+                    raise RuntimeError('deployment wave ' + str(waveIndex + 1) + ' of ' + str(len(waves)) + ' failed, later waves were not applied\n'
+                                       + '\n'.join(failures))
+                print('Deployment wave ' + str(waveIndex + 1) + ' of ' + str(len(waves)) + ': ' + str(len(units)) + ' units, '
+                      + str(sum(len(batches) for unitName, batches in units)) + ' batches in ' + '%.2f' % (time.time() - start) + 's')
+    finally:
+        pool.close()
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description='Generates table types, merge procedures and CLR data access methods from a SQL Server database')
+    parser.add_argument('--host', default='tst25sqldbv04.test.lab.americancapital.com', help='database server to read the catalog from')
+    parser.add_argument('--database', default='DealSpanDEV', help='database to read the catalog from')
+    parser.add_argument('--schema', default='dbo', help='schema to generate from, objects outside dbo are generated schema qualified')
+    parser.add_argument('--include', action='append', default=[], metavar='PATTERN',
+                        help='only generate the tables and procedures whose name matches this wildcard pattern, can be repeated')
+    parser.add_argument('--exclude', action='append', default=[], metavar='PATTERN',
+                        help='skip the tables and procedures whose name matches this wildcard pattern, can be repeated')
+    parser.add_argument('--with-dependencies', dest='withDependencies', action='store_true',
+                        help='also generate the tables the included tables reference through foreign keys, and the procedures using them')
+    parser.add_argument('--cache', default='../../MetadataCache.db', help='metadata cache file, reused between runs')
+    parser.add_argument('--no-cache', dest='useCache', action='store_false', help='always read the full catalog from the database')
+    parser.add_argument('--incremental', action='store_true', help='only regenerate the objects that changed since the last incremental run')
+    parser.add_argument('--fetch-mode', dest='fetchMode', choices=['bulk', 'per-object'], default='bulk',
+                        help='read the catalog with a few set-based queries, or object by object over a connection pool')
+    parser.add_argument('--concurrency', type=int, default=4, help='catalog queries kept in flight at once in per-object fetch mode, and catalogs read at once with --targets')
+    parser.add_argument('--export-snapshot', dest='exportSnapshot', help='write the catalog to a snapshot file for offline generation, then exit')
+    parser.add_argument('--snapshot', help='generate from a snapshot file written by --export-snapshot instead of a database')
+    parser.add_argument('--templates', help='directory of <artifact>.template files overriding the built-in output templates')
+    parser.add_argument('--write-templates', dest='writeTemplates', help='write the built-in templates to a directory for customising, then exit')
+    parser.add_argument('--benchmark-templates', dest='benchmarkTemplates', type=int, help='render this many synthetic objects per template, then exit')
+    parser.add_argument('--memory-report', dest='memoryReport', action='store_true', help='print how much memory the loaded catalog takes')
+    parser.add_argument('--typed-readers', dest='typedReaders', action='store_true',
+                        help='generate typed row classes and SqlDataReader accessors for Get procedures instead of DataTable ones')
+    parser.add_argument('--async', dest='asyncOutput', action='store_true',
+                        help='generate Task returning accessors and async controllers taking a CancellationToken instead of synchronous ones')
+    parser.add_argument('--merge-mode', dest='mergeMode', choices=['full', 'upsert', 'scoped'], default='full',
+                        help='merge procedures that delete every row missing from the batch (full), never delete (upsert), '
+                             + 'or only delete rows sharing a leading key value with the batch (scoped); upsert and scoped skip unchanged rows')
+    parser.add_argument('--keyed-table-types', dest='keyedTableTypes', action='store_true', help='declare the primary key on generated table types')
+    parser.add_argument('--memory-optimized', dest='memoryOptimized', action='store_true', help='make keyed table types memory optimized, implies --keyed-table-types')
+    parser.add_argument('--bulk-setters', dest='bulkSetters', action='store_true',
+                        help='also generate SqlBulkCopy setters that merge from a staging table, for very large batches')
+    parser.add_argument('--compact', action='store_true',
+                        help='generate one shared helper per accessor signature and one line accessors and setters calling it')
+    parser.add_argument('--split-classes', dest='splitClasses', action='store_true',
+                        help='write the C# as a partial class file per table or procedure entity instead of two large files')
+    parser.add_argument('--compile-command', dest='compileCommand',
+                        help='command that builds the generated code, run and timed after generation')
+    parser.add_argument('--deploy', help='apply a generated SQL script to the database wave by wave, then exit')
+    parser.add_argument('--deploy-connections', dest='deployConnections', type=int, default=4,
+                        help='connections used to apply the tables of a deployment wave concurrently')
+    parser.add_argument('--targets', help='JSON list of {"name", "host", "database"} targets to generate for at once, each into '
+                        + 'its own directory, with a report of the objects that differ between them')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running, regenerating incrementally whenever a table, procedure, table type, view or function changes')
+    parser.add_argument('--watch-interval', dest='watchInterval', type=float, default=0.5, help='seconds between change polls in watch mode')
+    parser.add_argument('--watch-status', dest='watchStatus', default=os.path.join(outputDirectory, watchStatusFileName),
+                        help='JSON file watch mode keeps updated with its poll and regeneration latency')
+    parser.add_argument('--jobs', type=int, default=1, help='number of processes used to generate tables and procedures')
+    parser.add_argument('--profile', help='write a JSON report of stage timings, catalog queries, output sizes and the slowest objects to this file')
+    parser.add_argument('--profile-top', dest='profileTop', type=int, default=10, help='number of slowest tables and procedures listed in the profile')
+    arguments = parser.parse_args()
+    if arguments.splitClasses and (arguments.incremental or arguments.watch):
+        parser.error('--split-classes writes every file in full, it can\'t be combined with --incremental or --watch')
+    if (arguments.include or arguments.exclude) and (arguments.compact or arguments.splitClasses or arguments.targets):
+        parser.error('--include and --exclude splice the selected objects into the outputs of an earlier run, '
+                     + 'they can\'t be combined with --compact, --split-classes or --targets')
+    return arguments
+
+def loadCatalogFromDatabase(arguments):
+    queryStats = createQueryStats()
+    if pymssql is None:
+        raise ImportError('pymssql is required to read the catalog from ' + arguments.host)
+    connect = lambda : ProfiledConnection(pymssql.connect(host=arguments.host, database=arguments.database))
+    with connect() as connection:
+        with profileStage('catalog discovery'):
+            discoverObjects(connection, arguments)
+        pool = None
+        fetchSelected = None
+        if arguments.fetchMode == 'per-object':
+            pool = ConnectionPool(connect, arguments.concurrency)
+            fetchSelected = lambda selectedTables, selectedProcs : fetchCatalogPerObject(pool, selectedTables, selectedProcs, arguments.concurrency, queryStats)
+        try:
+            with profileStage('metadata fetch'):
+                catalog, cacheStats = fetchCatalog(connection, arguments, fetchSelected)
+        finally:
+            if pool is not None:
+                pool.close()
+    printQueryStats(queryStats, arguments.concurrency)
+    return catalog, cacheStats
+
+def discoverObjects(connection, arguments):
+    # fills tableNames and procNames with the objects to generate
+    del tableNames[:]
+    del procNames[:]
+    setProcs(connection)
+    getProcs(connection)
+    getTables(connection)
+    if selectionRequested(arguments):
+        selectObjects(connection, arguments.include, arguments.exclude, arguments.withDependencies)
+
+def fetchCatalog(connection, arguments, fetchSelected):
+    # a selective run only reads the metadata of the selected objects
+    cacheStats = None
+    selectedOnly = selectionRequested(arguments)
+    if arguments.useCache:
+        catalog, cacheStats = loadCachedCatalog(connection, arguments.cache, catalogDatabaseName(arguments), fetchSelected, selectedOnly)
+    elif fetchSelected is not None:
+        catalog = fetchSelected(tableNames, procNames)
+    elif selectedOnly:
+        catalog = loadCatalog(connection, tableNames, procNames)
+    else:
+        catalog = loadCatalog(connection)
+    return catalog, cacheStats
+
+def catalogDatabaseName(arguments):
+    # names the catalog in the metadata cache and in snapshots
+    return arguments.host + '/' + arguments.database + ('/' + arguments.schema if arguments.schema != 'dbo' else '')
+
+def writeRenderedOutputs(outputPaths, renderedFragments):
+    # writes the fragments of each plan entry, as renderPlan yields them, in order
+    outputFiles = dict((fileKey, open(path, 'wb', buffering=outputBufferSize)) for fileKey, path in outputPaths.items())
+    try:
+        for fragments in renderedFragments:
+            with profileStage('file writes'):
+                for fileKey, fragment in fragments.items():
+                    outputFiles[fileKey].write(fragment)
+    finally:
+        for outputFile in outputFiles.values():
+            outputFile.close()
+
+def planEntryEntity(objectType, objectName, knownTables):
+    # the partial class file a plan entry's C# goes to: its table, or the table a procedure is named after,
+    # singular or plural (GetCustomers, GetCustomer and SetCustomer go with Customer, GetCompanies with
+    # Company), falling back to the procedure name without its prefix
+    if objectType == 'tables':
+        return objectName
+    if objectType == 'procs':
+        entity = genericProcName(objectName)
+        candidates = [entity]
+        if entity.endswith('ies'):
+            candidates.append(entity[:-3] + 'y')
+        if entity.endswith('es'):
+            candidates.append(entity[:-2])
+        if entity.endswith('s'):
+            candidates.append(entity[:-1])
+        for candidate in candidates:
+            if candidate in knownTables:
+                return candidate
+        return entity
+    return splitSharedEntity
+
+def partialClassText(fileKey, fragments):
+    yield (''.join('using ' + namespace + ';\n' for namespace in splitFileUsings) + '\n'
+           + partialClassDeclarations[fileKey] + '\n{\n').replace('\n', os.linesep).encode(outputEncoding)
+    yield from fragments
+    yield ('}\n').replace('\n', os.linesep).encode(outputEncoding)
+
+def writeSplitOutputs(directory, plan, renderedFragments):
+    # the SQL still goes to one script, in deployment order; returns the paths written
+    entityFragments = dict((fileKey, {}) for fileKey in splitDirectories)
+    knownTables = set(tableNames)
+    sqlPath = os.path.join(directory, dict(outputFileNames)['sql'])
+    with open(sqlPath, 'wb', buffering=outputBufferSize) as sqlFile:
+        for (objectType, objectName), fragments in zip(plan, renderedFragments):
+            with profileStage('file writes'):
+                sqlFile.write(fragments['sql'])
+            for fileKey in splitDirectories:
+                if len(fragments[fileKey].strip()) != 0:
+                    entityFragments[fileKey].setdefault(planEntryEntity(objectType, objectName, knownTables), []).append(fragments[fileKey])
+    writtenPaths = [sqlPath]
+    for fileKey, directoryName in splitDirectories.items():
+        entityDirectory = os.path.join(directory, directoryName)
+        if not os.path.isdir(entityDirectory):
+            os.makedirs(entityDirectory)
+        for entity, fragments in entityFragments[fileKey].items():
+            path = os.path.join(entityDirectory, entity + splitFileExtension)
+            with profileStage('file writes'), open(path, 'wb') as entityFile:
+                entityFile.writelines(partialClassText(fileKey, fragments))
+            writtenPaths.append(path)
+    return writtenPaths
+
+def removeStaleSplitOutputs(directory, writtenPaths):
+    # a split run replaces the single C# files, and drops the partial class files of entities no longer
+    # generated; only files an earlier split run recorded writing are removed, the directories may hold others
+    recordPath = os.path.join(directory, splitRecordFileName)
+    writtenFiles = [os.path.relpath(path, directory) for path in writtenPaths]
+    try:
+        with open(recordPath, 'r') as recordFile:
+            recordedFiles = json.load(recordFile)
+    except (IOError, ValueError):
+        recordedFiles = []
+    staleFiles = [fileName for fileKey, fileName in outputFileNames if fileKey in splitDirectories]
+    staleFiles += [fileName for fileName in recordedFiles if fileName not in writtenFiles]
+    for fileName in staleFiles:
+        if os.path.exists(os.path.join(directory, fileName)):
+            os.remove(os.path.join(directory, fileName))
+    with open(recordPath, 'w') as recordFile:
+        json.dump(writtenFiles, recordFile, indent=2)
+
+def writePlanOutputs(directory, plan, renderedFragments):
+    # full run outputs from rendered plan fragments; returns the paths written
+    if generationOptions['splitClasses']:
+        writtenPaths = writeSplitOutputs(directory, plan, renderedFragments)
+        removeStaleSplitOutputs(directory, writtenPaths)
+    else:
+        outputPaths = dict((fileKey, os.path.join(directory, fileName)) for fileKey, fileName in outputFileNames)
+        writeRenderedOutputs(outputPaths, renderedFragments)
+        writtenPaths = list(outputPaths.values())
+    return writtenPaths
+
+def generateOutputs(catalog, directory, jobs = 1):
+    # a full run invalidates the layout recorded by a previous incremental run
+    manifestPath = os.path.join(directory, manifestFileName)
+    if os.path.exists(manifestPath):
+        os.remove(manifestPath)
+    outputPaths = dict((fileKey, os.path.join(directory, fileName)) for fileKey, fileName in outputFileNames)
+    if jobs > 1 or generationOptions['splitClasses']:
+        plan = buildGenerationPlan(catalog)
+        writtenPaths = writePlanOutputs(directory, plan, renderPlan(catalog, plan, jobs))
+    else:
+        with open(outputPaths['controller'], 'w', buffering=outputBufferSize) as controllerAccessMethodsFile:
+            with open(outputPaths['dataAccess'], 'w', buffering=outputBufferSize) as dataAccessMethodsFile:
+                with open(outputPaths['sql'], 'w', buffering=outputBufferSize) as sqlStatementFile:
+                    generateCLRDataAccessorsFromStoredProcedure(controllerAccessMethodsFile, dataAccessMethodsFile, catalog)
+                    generateCLRDataSettersFromTableDefinitions(controllerAccessMethodsFile, dataAccessMethodsFile, sqlStatementFile, catalog)
+        writtenPaths = list(outputPaths.values())
+    for path in writtenPaths:
+        recordOutputBytes(os.path.relpath(path, directory), os.path.getsize(path))
+
+def reportGeneratedCode(directory):
+    # size of the generated C#, to compare output modes
+    if generationOptions['splitClasses']:
+        with open(os.path.join(directory, splitRecordFileName), 'r') as recordFile:
+            paths = [os.path.join(directory, fileName) for fileName in json.load(recordFile) if fileName.endswith(splitFileExtension)]
+    else:
+        paths = [os.path.join(directory, fileName) for fileKey, fileName in outputFileNames if fileKey in splitDirectories]
+    generatedCode = { 'files' : 0, 'lines' : 0, 'bytes' : 0 }
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, 'rb') as codeFile:
+                text = codeFile.read()
+            generatedCode['files'] += 1
+            generatedCode['lines'] += text.count(b'\n')
+            generatedCode['bytes'] += len(text)
+    runProfile['generatedCode'] = generatedCode
+    print('Generated C#: ' + str(generatedCode['lines']) + ' lines, ' + str(generatedCode['bytes']) + ' bytes in ' + str(generatedCode['files']) + ' files')
+
+def runCompileCommand(command):
+    # times the downstream build of the generated code
+    start = time.time()
+    exitCode = subprocess.call(command, shell=True)
+    runProfile['compileSeconds'] = round(time.time() - start, 6)
+    print('Compile command exited with ' + str(exitCode) + ' in ' + '%.2f' % runProfile['compileSeconds'] + 's')
+
+# multi-target runs: every target's outputs go to a directory named after it, and the objects
+# that differ between targets are listed in the drift report
+driftReportFileName = 'SchemaDrift.json'
+
+def loadTargets(targetsPath):
+    # a JSON list of { "name", "host", "database" } objects, the name defaulting to the database
+    with open(targetsPath, 'r') as targetsFile:
+        targets = json.load(targetsFile)
+    if not targets:
+        raise ValueError(targetsPath + ' lists no targets')
+    for target in targets:
+        target.setdefault('name', target['database'])
+    return targets
+
+def targetCachePath(cachePath, targetName):
+    # one metadata cache file per target, so the target processes never wait on each other's writes
+    cacheRoot, cacheExtension = os.path.splitext(cachePath)
+    return cacheRoot + '.' + targetName + cacheExtension
+
+def fetchTargetCatalog(target, arguments, options):
+    # runs in a process of its own, so the discovery can fill that process's tableNames and procNames
+    generationOptions.update(options)
+    targetArguments = argparse.Namespace(**dict(vars(arguments), host=target['host'], database=target['database'],
+                                                cache=targetCachePath(arguments.cache, target['name'])))
+    catalog, cacheStats = loadCatalogFromDatabase(targetArguments)
+    return catalog, list(tableNames), list(procNames), cacheStats
+
+def fetchTargetCatalogs(targets, arguments):
+    # reads up to --concurrency targets' catalogs at once; a target that can't be read is reported and left out.
+    # Returns the catalogs and the targets' metadata cache stats added up, None without a cache
+    targetCatalogs = []
+    combinedStats = None
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, min(len(targets), arguments.concurrency))) as executor:
+        futures = [(target, executor.submit(fetchTargetCatalog, target, arguments, generationOptions)) for target in targets]
+        for target, future in futures:
+            try:
+                catalog, targetTableNames, targetProcNames, cacheStats = future.result()
+            except Exception as exception:
+                print('Could not read the catalog of ' + target['name'] + ': ' + str(exception))
+                continue
+            targetCatalogs.append((target, catalog, targetTableNames, targetProcNames))
+            if cacheStats is not None:
+                combinedStats = dict((name, count + (combinedStats[name] if combinedStats is not None else 0)) for name, count in cacheStats.items())
+    return targetCatalogs, combinedStats
+
+def streamTargetFragments(planHashes, renderedFragments, keptFragments, remainingUses):
+    # yields a target's fragments in plan order, taking the ones not kept from an earlier target from its own
+    # renders; a fragment is only kept while a later target still has an object with the same fingerprint
+    for sourceHash in planHashes:
+        fragments = keptFragments.pop(sourceHash, None)
+        if fragments is None:
+            fragments = next(renderedFragments)
+        remainingUses[sourceHash] -= 1
+        if remainingUses[sourceHash] > 0:
+            keptFragments[sourceHash] = fragments
+        yield fragments
+
+def generateTargets(targetCatalogs, jobs = 1):
+    # an object's source hash is its structural fingerprint, so each distinct object is rendered once
+    # and every target with the same fingerprint reuses its fragments; returns each target's fingerprints
+    targetPlans = []
+    remainingUses = {}
+    fingerprints = {}
+    for target, catalog, targetTableNames, targetProcNames in targetCatalogs:
+        tableNames[:] = targetTableNames
+        procNames[:] = targetProcNames
+        plan = buildGenerationPlan(catalog)
+        planHashes = [getSourceHash(catalog, objectType, objectName) for objectType, objectName in plan]
+        fingerprints[target['name']] = dict((objectType + '/' + objectName, sourceHash) for (objectType, objectName), sourceHash in zip(plan, planHashes)
+                                            if objectType in ('tables', 'procs'))
+        for sourceHash in planHashes:
+            remainingUses[sourceHash] = remainingUses.get(sourceHash, 0) + 1
+        targetPlans.append((plan, planHashes))
+
+    keptFragments = {}
+    renderedCount = 0
+    objectCount = 0
+    for (target, catalog, targetTableNames, targetProcNames), (plan, planHashes) in zip(targetCatalogs, targetPlans):
+        tableNames[:] = targetTableNames
+        procNames[:] = targetProcNames
+        pendingPlan = [planEntry for planEntry, sourceHash in zip(plan, planHashes) if sourceHash not in keptFragments]
+        renderedCount += len(pendingPlan)
+        renderedFragments = iter(renderPlan(catalog, pendingPlan, jobs))
+
+        directory = os.path.join(outputDirectory, target['name'])
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        manifestPath = os.path.join(directory, manifestFileName)
+        if os.path.exists(manifestPath):
+            os.remove(manifestPath)
+        for path in writePlanOutputs(directory, plan, streamTargetFragments(planHashes, renderedFragments, keptFragments, remainingUses)):
+            recordOutputBytes(os.path.join(target['name'], os.path.relpath(path, directory)), os.path.getsize(path))
+        objectCount += len(plan)
+    print('Generated ' + str(len(targetCatalogs)) + ' targets: ' + str(renderedCount) + ' distinct objects rendered for '
+          + str(objectCount) + ' objects')
+    return fingerprints
+
+def writeDriftReport(reportPath, fingerprints, unavailableTargets):
+    # lists every table and procedure whose fingerprint is not the same in all targets, a missing object
+    # counting as a difference; fingerprints are shortened, equal ones mean identical definitions
+    targetNames = list(fingerprints)
+    objectKeys = sorted(set(key for targetFingerprints in fingerprints.values() for key in targetFingerprints))
+    drift = {}
+    for key in objectKeys:
+        variants = [fingerprints[targetName].get(key) for targetName in targetNames]
+        if len(set(variants)) > 1:
+            drift[key] = dict((targetName, variant[:12] if variant is not None else 'missing') for targetName, variant in zip(targetNames, variants))
+    with open(reportPath, 'w') as reportFile:
+        json.dump({ 'targets' : targetNames, 'unavailable' : unavailableTargets, 'objects' : len(objectKeys), 'drift' : drift },
+                  reportFile, indent=2, sort_keys=True)
+    print('Schema drift: ' + str(len(drift)) + ' of ' + str(len(objectKeys)) + ' objects differ between targets, see ' + reportPath)
+
+def generateForTargets(arguments):
+    targets = loadTargets(arguments.targets)
+    with profileStage('metadata fetch'):
+        targetCatalogs, cacheStats = fetchTargetCatalogs(targets, arguments)
+    fingerprints = generateTargets(targetCatalogs, arguments.jobs)
+    readTargets = set(target['name'] for target, catalog, targetTableNames, targetProcNames in targetCatalogs)
+    writeDriftReport(os.path.join(outputDirectory, driftReportFileName), fingerprints,
+                     [target['name'] for target in targets if target['name'] not in readTargets])
+    if cacheStats is not None:
+        printCacheStats(cacheStats)
+
+# watch mode polls this high-water mark; it moves whenever a table, procedure or table type is
+# created, altered or dropped, or a view or function a procedure can reference and be stamped with
+catalogHighWaterQuery = "select convert(varchar(23), max(o.modify_date), 126), count(*) \n" \
+                        + "from sys.objects o \n" \
+                        + "where o.schema_id = schema_id(%s) \n" \
+                        + "and o.type in ('U', 'P', 'TT', 'V', 'IF', 'TF', 'FN') \n"
+
+def fetchHighWaterMark(connection):
+    return tuple(fetchRows(connection, catalogHighWaterQuery, (generationOptions['schema'],))[0])
+
+def refreshCatalog(connection, catalog, modifyDates, arguments):
+    # rediscovers the objects and re-reads only those added or modified since modifyDates was taken,
+    # dropped objects fall out of the catalog; returns the new modify dates
+    discoverObjects(connection, arguments)
+    newModifyDates = fetchModifyDates(connection, tableNames + procNames if selectionRequested(arguments) else None)
+    refetchNames = {}
+    for objectType, objectNames in (('tables', tableNames), ('procs', procNames)):
+        refetchNames[objectType] = [objectName for objectName in objectNames if objectName not in catalog[objectType]
+                                    or newModifyDates[objectType].get(objectName) != modifyDates[objectType].get(objectName)]
+    if len(refetchNames['tables']) != 0 or len(refetchNames['procs']) != 0:
+        fetchedCatalog = loadCatalog(connection, refetchNames['tables'], refetchNames['procs'])
+        for objectType in ('tables', 'procs'):
+            catalog[objectType].update(fetchedCatalog[objectType])
+            for objectName in fetchedCatalog[objectType]:
+                catalog.get('hashes', {}).get(objectType, {}).pop(objectName, None)
+    catalog['tables'] = dict((tableName, catalog['tables'][tableName]) for tableName in tableNames)
+    catalog['procs'] = dict((procName, catalog['procs'][procName]) for procName in procNames)
+    catalog.pop('derived', None)
+    return newModifyDates
+
+def writeWatchStatus(statusPath, status):
+    temporaryPath = statusPath + '.tmp'
+    with open(temporaryPath, 'w') as statusFile:
+        json.dump(status, statusFile, indent=2, sort_keys=True)
+    os.replace(temporaryPath, statusPath)
+
+def watchDatabase(arguments):
+    # keeps one connection and the catalog in memory, polling the high-water mark every interval;
+    # when it moves the changed objects are refreshed and regenerated incrementally. A failed cycle
+    # is recorded in the status file and retried on a new connection
+    if pymssql is None:
+        raise ImportError('pymssql is required to watch ' + arguments.host)
+    connect = lambda : ProfiledConnection(pymssql.connect(host=arguments.host, database=arguments.database, autocommit=True))
+    status = { 'database' : catalogDatabaseName(arguments), 'polls' : 0, 'regenerations' : 0, 'lastPollSeconds' : None,
+               'lastRegenerationSeconds' : None, 'lastRegeneratedObjects' : None, 'lastChange' : None, 'lastError' : None }
+    connection = None
+    catalog = None
+    modifyDates = None
+    highWaterMark = None
+    print('Watching ' + status['database'] + ', status in ' + arguments.watchStatus)
+    try:
+        while True:
+            cycleStart = time.time()
+            try:
+                if connection is None:
+                    connection = connect()
+                newHighWaterMark = fetchHighWaterMark(connection)
+                if newHighWaterMark != highWaterMark:
+                    if catalog is None:
+                        discoverObjects(connection, arguments)
+                        modifyDates = fetchModifyDates(connection, tableNames + procNames if selectionRequested(arguments) else None)
+                        catalog = fetchCatalog(connection, arguments, None)[0]
+                    else:
+                        modifyDates = refreshCatalog(connection, catalog, modifyDates, arguments)
+                    status['lastRegeneratedObjects'] = generateIncrementally(catalog, outputDirectory, arguments.jobs, objectSelection(arguments))
+                    status['lastRegenerationSeconds'] = time.time() - cycleStart
+                    status['lastChange'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+                    status['regenerations'] += 1
+                    highWaterMark = newHighWaterMark
+                    print('Regenerated in ' + '%.2f' % status['lastRegenerationSeconds'] + 's')
+                status['lastError'] = None
+            except Exception as exception:
+                status['lastError'] = str(exception)
+                print('Watch cycle failed: ' + str(exception))
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+                    connection = None
+            status['polls'] += 1
+            status['lastPollSeconds'] = time.time() - cycleStart
+            status['updated'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+            writeWatchStatus(arguments.watchStatus, status)
+            time.sleep(max(0.0, arguments.watchInterval - (time.time() - cycleStart)))
+    except KeyboardInterrupt:
+        print('Stopped watching ' + status['database'])
+    finally:
+        if connection is not None:
+            connection.close()
+
 def main():
-    with open('../../ControllerMethodsFile.cs', 'w') as controllerAccessMethodsFile:
-        with open('../../DataAccessMethodsFile.cs', 'w') as dataAccessMethodsFile:
-            with open('../../SQLStatementFile.sql', 'w') as sqlStatementFile:
-                with pymssql.connect(host='tst25sqldbv04.test.lab.americancapital.com', database='DealSpanDEV') as connection:
-                        setProcs(connection)
-                        getProcs(connection)
-                        getTables(connection)
-                        generateCLRDataAccessorsFromStoredProcedure(controllerAccessMethodsFile, dataAccessMethodsFile, connection)
-                        generateCLRDataSettersFromTableDefinitions(controllerAccessMethodsFile, dataAccessMethodsFile, sqlStatementFile, connection)
-
-main()
+    runStart = time.time()
+    arguments = parseArguments()
+    if arguments.writeTemplates:
+        writeTemplates(arguments.writeTemplates)
+        return
+    if arguments.deploy:
+        deployScript(arguments.deploy, arguments)
+        return
+    setTemplates(readTemplates(arguments.templates))
+    generationOptions['typedReaders'] = arguments.typedReaders
+    generationOptions['async'] = arguments.asyncOutput
+    generationOptions['mergeMode'] = arguments.mergeMode
+    generationOptions['keyedTableTypes'] = arguments.keyedTableTypes or arguments.memoryOptimized
+    generationOptions['memoryOptimized'] = arguments.memoryOptimized
+    generationOptions['bulkSetters'] = arguments.bulkSetters
+    generationOptions['schema'] = arguments.schema
+    generationOptions['compact'] = arguments.compact
+    generationOptions['splitClasses'] = arguments.splitClasses
+    if arguments.benchmarkTemplates:
+        benchmarkTemplates(arguments.benchmarkTemplates)
+        return
+    if arguments.watch:
+        watchDatabase(arguments)
+        return
+    if arguments.targets:
+        generateForTargets(arguments)
+        if arguments.profile:
+            writeProfileReport(arguments.profile, time.time() - runStart, arguments.profileTop)
+        return
+    if arguments.snapshot:
+        loadStart = time.time()
+        with profileStage('metadata fetch'):
+            catalog, databaseName = loadSnapshot(arguments.snapshot)
+        cacheStats = None
+        print('Loaded snapshot of ' + databaseName + ': ' + str(len(tableNames)) + ' tables and ' + str(len(procNames))
+              + ' procedures in ' + '%.2f' % (time.time() - loadStart) + 's')
+    else:
+        catalog, cacheStats = loadCatalogFromDatabase(arguments)
+        databaseName = catalogDatabaseName(arguments)
+    if arguments.exportSnapshot:
+        writeSnapshot(arguments.exportSnapshot, catalog, databaseName)
+        print('Wrote snapshot of ' + str(len(tableNames)) + ' tables and ' + str(len(procNames)) + ' procedures to ' + arguments.exportSnapshot)
+        return
+    if arguments.memoryReport:
+        printCatalogMemoryUsage(catalog)
+    if arguments.incremental or selectionRequested(arguments):
+        generateIncrementally(catalog, outputDirectory, arguments.jobs, objectSelection(arguments))
+    else:
+        generateOutputs(catalog, outputDirectory, arguments.jobs)
+    reportGeneratedCode(outputDirectory)
+    if arguments.compileCommand:
+        runCompileCommand(arguments.compileCommand)
+    if cacheStats is not None:
+        printCacheStats(cacheStats)
+    if arguments.profile:
+        writeProfileReport(arguments.profile, time.time() - runStart, arguments.profileTop)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+# Details: Benchmarks ScriptDB.py against synthetic catalogs, no SQL Server required
+# Author: Jon Fast
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, peak RSS is reported as unknown there
+    resource = None
+
+import ScriptDB
+
+scalarParameterTypes = [typeName for typeName in ScriptDB.typeConverter if typeName not in ('table type', 'sql_variant')]
+# common types weighted up, every other scalar type still appears
+columnTypes = ['int', 'int', 'nvarchar', 'nvarchar', 'varchar', 'decimal', 'bit', 'datetime'] + scalarParameterTypes
+
+def createSyntheticType(dataTypes, randomGenerator):
+    # (data type, maximum length, precision, scale) as INFORMATION_SCHEMA reports them
+    dataType = randomGenerator.choice(dataTypes)
+    maximumLength = None
+    precision = None
+    scale = None
+    if dataType in ScriptDB.lengthTypes:
+        maximumLength = randomGenerator.choice([-1, 10, 50, 100, 255, 4000])
+    elif dataType in ('text', 'ntext', 'image'):
+        maximumLength = 2147483647
+    elif dataType == 'xml':
+        maximumLength = -1
+    elif dataType in ScriptDB.precisionTypes:
+        precision = randomGenerator.choice([10, 18, 28])
+        scale = randomGenerator.choice([0, 2, 4])
+    elif dataType == 'int':
+        precision = 10
+        scale = 0
+    return (dataType, maximumLength, precision, scale)
+
+def createSyntheticColumn(name, randomGenerator):
+    dataType, maximumLength, precision, scale = createSyntheticType(columnTypes, randomGenerator)
+    return (name, dataType, randomGenerator.choice(['YES', 'NO']), maximumLength, precision, scale)
+
+def createSyntheticParameter(name, randomGenerator):
+    return (name,) + createSyntheticType(scalarParameterTypes, randomGenerator) + (None,)
+
+def buildSyntheticSchema(tableCount, seed = 0):
+    # tables with 1 to 300 columns (skewed towards narrow tables), single and composite keys,
+    # identities, foreign keys to earlier tables, and Get/Set procedures with varied parameter types
+    randomGenerator = random.Random(seed)
+    tables = {}
+    procs = {}
+    for tableIndex in range(tableCount):
+        tableName = 'SyntheticTable' + str(tableIndex)
+        columnCount = int(randomGenerator.triangular(1, 300, 8))
+        keyCount = min(columnCount, randomGenerator.choice([0, 1, 1, 1, 2, 3]))
+        columns = []
+        for columnIndex in range(columnCount):
+            column = createSyntheticColumn(tableName + 'Column' + str(columnIndex), randomGenerator)
+            if columnIndex < keyCount:
+                column = (column[0], 'int', 'NO', None, 10, 0)
+            columns.append(column)
+        identity = columns[0][0] if keyCount == 1 and randomGenerator.random() < 0.5 else ''
+        foreignKeys = []
+        if tableIndex > 0 and columnCount > keyCount and randomGenerator.random() < 0.3:
+            foreignKeys.append((columns[keyCount][0], 'SyntheticTable' + str(randomGenerator.randrange(tableIndex))))
+        tables[tableName] = { 'columns' : columns, 'primaryKeys' : [column[0] for column in columns[:keyCount]],
+                              'foreignKeys' : foreignKeys, 'identity' : identity }
+
+        procs['Get' + tableName + 's'] = [createSyntheticParameter('@' + randomGenerator.choice(['isActive', 'asOfDate', 'name']), randomGenerator)
+                                          for parameterIndex in range(randomGenerator.randint(0, 3))]
+        procs['Get' + tableName] = [('@' + ScriptDB.camelCase(column[0]), column[1], column[3], column[4], column[5], None)
+                                    for column in columns[:max(keyCount, 1)]]
+        procs['Set' + tableName + 'Data'] = [('@' + tableName + 'Table', 'table type', None, None, None, 'dbo.' + tableName + 'Table')] \
+                                            + [createSyntheticParameter('@parameter' + str(parameterIndex), randomGenerator) for parameterIndex in range(randomGenerator.randint(0, 8))]
+    return tables, procs
+
+class SyntheticCursor(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+
+    def execute(self, queryString, params = None):
+        self.connection.queryCount += 1
+        self.rows = self.connection.answer(queryString, params)
+
+    def fetchall(self):
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        pass
+
+class SyntheticConnection(object):
+    # in-process stand-in for a pymssql connection, answering the catalog queries ScriptDB issues
+    def __init__(self, tables, procs):
+        self.tables = tables
+        self.procs = procs
+        self.queryCount = 0
+
+    def cursor(self):
+        return SyntheticCursor(self)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exceptionInfo):
+        self.close()
+
+    def selectedNames(self, names, params):
+        # catalog queries take the schema first and, when restricted to some objects, their names last
+        return sorted(names) if len(params) == 1 else sorted(set(names) & set(params[-1]))
+
+    def answer(self, queryString, params):
+        if 'INFORMATION_SCHEMA.Routines' in queryString:
+            prefix = 'Set' if "LIKE 'Set%%'" in queryString else 'Get'
+            return [(procName,) for procName in self.procs if procName.startswith(prefix)]
+        if 'INFORMATION_SCHEMA.Tables' in queryString:
+            return [(tableName,) for tableName in self.tables]
+        if queryString.startswith(ScriptDB.catalogColumnsQuery.split('order by ')[0]):
+            return [(tableName,) + column + (1 if column[0] == self.tables[tableName]['identity'] else 0,)
+                    for tableName in self.selectedNames(self.tables, params) for column in self.tables[tableName]['columns']]
+        if queryString.startswith(ScriptDB.catalogConstraintsQuery.split('order by ')[0]):
+            rows = []
+            for tableName in self.selectedNames(self.tables, params):
+                table = self.tables[tableName]
+                columns = dict((column[0], column) for column in table['columns'])
+                rows += [(tableName, columnName, 'FOREIGN KEY', columns[columnName][1], columns[columnName][2], referencedTable)
+                         for columnName, referencedTable in table['foreignKeys']]
+                rows += [(tableName, columnName, 'PRIMARY KEY', columns[columnName][1], columns[columnName][2], None) for columnName in table['primaryKeys']]
+            return rows
+        if queryString.startswith(ScriptDB.catalogParametersQuery.split('order by ')[0]):
+            return [(procName,) + parameter for procName in self.selectedNames(self.procs, params) for parameter in self.procs[procName]]
+        if queryString.startswith(ScriptDB.catalogResultColumnsQuery.split('order by ')[0]):
+            # Get<Table> and Get<Table>s return the table's columns
+            return [(procName,) + column[:3] for procName in self.selectedNames(self.procs, params) if procName.startswith('Get')
+                    for column in self.tables[procName[3:] if procName[3:] in self.tables else procName[3:-1]]['columns']]
+        if queryString == ScriptDB.catalogModifyDatesQuery:
+            return [(tableName, 'U ', '2014-10-07T00:00:00', None, None) for tableName in self.tables] \
+                   + [(procName, 'P ', '2014-10-07T00:00:00', None, None) for procName in self.procs]
+        raise ValueError('synthetic connection does not answer: ' + queryString)
+
+def getPeakRSS():
+    # bytes; ru_maxrss is in kilobytes on Linux and bytes on macOS
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname()[0] == 'Darwin' else peak * 1024
+
+@contextlib.contextmanager
+def timedStage(stages, stageName):
+    start = time.time()
+    yield
+    stages[stageName] = { 'seconds' : time.time() - start, 'peakRSS' : getPeakRSS() }
+
+def checkParallelOutput(catalog, outputDirectory, jobs):
+    # the process pool path has to write the same bytes as the serial one, with the options whose
+    # catalog wide state (deployment waves, compact helper groups) workers can't rebuild themselves
+    outputs = {}
+    ScriptDB.generationOptions['compact'] = True
+    try:
+        for runName, runJobs in (('serial', 1), ('parallel', jobs)):
+            catalog.pop('derived', None)
+            runDirectory = os.path.join(outputDirectory, runName)
+            os.makedirs(runDirectory)
+            with open(os.devnull, 'w') as devNull, contextlib.redirect_stdout(devNull):
+                ScriptDB.generateOutputs(catalog, runDirectory, runJobs)
+            outputs[runName] = []
+            for fileKey, fileName in ScriptDB.outputFileNames:
+                with open(os.path.join(runDirectory, fileName), 'rb') as outputFile:
+                    outputs[runName].append(outputFile.read())
+    finally:
+        ScriptDB.generationOptions['compact'] = False
+        catalog.pop('derived', None)
+    return { 'name' : 'serial and --jobs ' + str(jobs) + ' output identical (' + multiprocessing.get_start_method() + ' workers)',
+             'passed' : outputs['serial'] == outputs['parallel'] }
+
+def runPipeline(tables, procs, outputDirectory, jobs):
+    # drives the same pipeline as ScriptDB.main, with the synthetic connection in place of pymssql
+    del ScriptDB.tableNames[:]
+    del ScriptDB.procNames[:]
+    connection = SyntheticConnection(tables, procs)
+    stages = {}
+    outputPaths = dict((fileKey, os.path.join(outputDirectory, fileName)) for fileKey, fileName in ScriptDB.outputFileNames)
+    with open(os.devnull, 'w') as devNull, contextlib.redirect_stdout(devNull):
+        with timedStage(stages, 'catalog discovery'):
+            ScriptDB.setProcs(connection)
+            ScriptDB.getProcs(connection)
+            ScriptDB.getTables(connection)
+        with timedStage(stages, 'metadata fetch'):
+            catalog = ScriptDB.loadCatalog(connection)
+        snapshotPath = os.path.join(outputDirectory, 'Catalog.snapshot')
+        ScriptDB.writeSnapshot(snapshotPath, catalog, 'synthetic')
+        with timedStage(stages, 'snapshot load'):
+            catalog, databaseName = ScriptDB.loadSnapshot(snapshotPath)
+        with open(outputPaths['controller'], 'w', buffering=ScriptDB.outputBufferSize) as controllerAccessMethodsFile:
+            with open(outputPaths['dataAccess'], 'w', buffering=ScriptDB.outputBufferSize) as dataAccessMethodsFile:
+                with open(outputPaths['sql'], 'w', buffering=ScriptDB.outputBufferSize) as sqlStatementFile:
+                    with timedStage(stages, 'accessor generation'):
+                        ScriptDB.generateCLRDataAccessorsFromStoredProcedure(controllerAccessMethodsFile, dataAccessMethodsFile, catalog)
+                    with timedStage(stages, 'setter generation'):
+                        ScriptDB.generateCLRDataSettersFromTableDefinitions(controllerAccessMethodsFile, dataAccessMethodsFile, sqlStatementFile, catalog)
+    outputBytes = sum(os.path.getsize(path) for path in outputPaths.values())
+    # a snapshot only builds the objects generation looks up, so its load should stay close to the unpickle
+    snapshotLoadLimit = max(1.0, len(tables) / 10000.0)
+    checks = [checkParallelOutput(catalog, outputDirectory, jobs),
+              { 'name' : 'snapshot load under ' + '%.1f' % snapshotLoadLimit + 's', 'passed' : stages['snapshot load']['seconds'] < snapshotLoadLimit }]
+    snapshotBytes = os.path.getsize(snapshotPath)
+    generationSeconds = stages['accessor generation']['seconds'] + stages['setter generation']['seconds']
+    return {
+        'tables' : len(tables),
+        'columns' : sum(len(table['columns']) for table in tables.values()),
+        'procedures' : len(procs),
+        'catalogQueries' : connection.queryCount,
+        'stages' : stages,
+        'totalSeconds' : sum(stage['seconds'] for stage in stages.values()),
+        'snapshotBytes' : snapshotBytes,
+        'outputBytes' : outputBytes,
+        'outputBytesPerSecond' : outputBytes / max(generationSeconds, 1e-9),
+        'peakRSS' : getPeakRSS(),
+        'checks' : checks
+        }
+
+def formatBytes(byteCount):
+    if byteCount is None:
+        return 'unknown'
+    for unit in ('B', 'KB', 'MB'):
+        if byteCount < 1024:
+            return '%.1f' % byteCount + unit
+        byteCount /= 1024.0
+    return '%.1f' % byteCount + 'GB'
+
+def printResult(result, baselineResult):
+    print(str(result['tables']) + ' tables, ' + str(result['columns']) + ' columns, ' + str(result['procedures']) + ' procedures, '
+          + str(result['catalogQueries']) + ' catalog queries')
+    for stageName, stage in result['stages'].items():
+        line = '\t' + stageName + ': ' + '%.3f' % stage['seconds'] + 's, peak RSS ' + formatBytes(stage['peakRSS'])
+        if baselineResult is not None and stageName in baselineResult['stages'] and baselineResult['stages'][stageName]['seconds'] > 0:
+            line += ' (' + '%+.1f' % (100 * (stage['seconds'] / baselineResult['stages'][stageName]['seconds'] - 1)) + '% vs baseline)'
+        print(line)
+    print('\tsnapshot: ' + formatBytes(result['snapshotBytes']))
+    print('\toutput: ' + formatBytes(result['outputBytes']) + ' at ' + formatBytes(result['outputBytesPerSecond']) + '/s')
+    for check in result['checks']:
+        print('\t' + ('pass' if check['passed'] else 'FAIL') + ': ' + check['name'])
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description='Benchmarks ScriptDB.py against synthetic catalogs')
+    parser.add_argument('--sizes', default='100,1000,10000', help='comma separated table counts to benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the synthetic schemas, keep it fixed to compare runs')
+    parser.add_argument('--results', default='BenchmarkResults', help='directory the results are saved in')
+    parser.add_argument('--label', default=time.strftime('%Y%m%d-%H%M%S'), help='name of the saved results file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--jobs', type=int, default=2, help='processes used for the serial against process pool output check')
+    return parser.parse_args()
+
+def main():
+    arguments = parseArguments()
+    # the pool check spawns its workers the way Windows, where the generator runs, always does
+    multiprocessing.set_start_method('spawn', force=True)
+    baseline = None
+    if arguments.baseline:
+        with open(arguments.baseline, 'r') as baselineFile:
+            baseline = json.load(baselineFile)
+
+    results = { 'label' : arguments.label, 'seed' : arguments.seed, 'runs' : {} }
+    for size in [int(size) for size in arguments.sizes.split(',')]:
+        tables, procs = buildSyntheticSchema(size, arguments.seed)
+        outputDirectory = tempfile.mkdtemp(prefix='ScriptDBBenchmark')
+        try:
+            result = runPipeline(tables, procs, outputDirectory, arguments.jobs)
+        finally:
+            shutil.rmtree(outputDirectory)
+        results['runs'][str(size)] = result
+        printResult(result, baseline['runs'].get(str(size)) if baseline is not None else None)
+
+    if not os.path.exists(arguments.results):
+        os.makedirs(arguments.results)
+    resultsPath = os.path.join(arguments.results, arguments.label + '.json')
+    with open(resultsPath, 'w') as resultsFile:
+        json.dump(results, resultsFile, indent=4)
+    print('Results saved to ' + resultsPath)
+    if not all(check['passed'] for result in results['runs'].values() for check in result['checks']):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()